@@ -12,4 +12,7 @@ MQTT_TOPIC_TEMP = 'home/temp/plant'
 MQTT_TOPIC_SOIL_1 = 'home/soil/plant1'
 MQTT_TOPIC_SOIL_2 = 'home/soil/plant2'
 
+# Either 'json' or the compact 'binary' telemetry format
+PAYLOAD_FORMAT = 'json'
+
 LOG_INTERVAL = 60
@@ -1,5 +1,6 @@
 import json
 import machine
+import struct
 import time
 import ubinascii
 
@@ -12,6 +13,10 @@ import config
 
 CLIENT_ID = ubinascii.hexlify(machine.unique_id())
 
+TELEMETRY_VERSION = 1
+RECORD_THERMOMETER = 2
+RECORD_SOIL_SENSOR = 3
+
 
 def run():
     connect_wifi()
@@ -57,12 +62,24 @@ def get_temperature_sensor_readings():
     bme280 = BME280(i2c=i2c)
     temperature, _, humidity = bme280.read_compensated_data()
 
+    if config.PAYLOAD_FORMAT == 'binary':
+        return struct.pack(
+            '<BBHffff',
+            TELEMETRY_VERSION,
+            RECORD_THERMOMETER,
+            1,
+            temperature,
+            humidity,
+            bme280.heat_index,
+            bme280.dew_point
+        )
+
     return json.dumps({
         'temperature': temperature,
         'humidity': humidity,
         'heat_index': bme280.heat_index,
         'dew_point': bme280.dew_point
-    })
+    }).encode()
 
 
 def get_soil_sensor_readings(adc_pin):
@@ -74,10 +91,20 @@ def get_soil_sensor_readings(adc_pin):
 
     moisture_value, moisture_level, _ = sensor.read_data()
 
+    if config.PAYLOAD_FORMAT == 'binary':
+        return struct.pack(
+            '<BBHHB',
+            TELEMETRY_VERSION,
+            RECORD_SOIL_SENSOR,
+            1,
+            moisture_value,
+            moisture_level
+        )
+
     return json.dumps({
         'moisture_value': moisture_value,
         'moisture_level': moisture_level,
-    })
+    }).encode()
 
 
 def publish(data):
@@ -96,7 +123,7 @@ def publish(data):
 
         client.publish(
             topic=topic.encode(),
-            msg=msg.encode()
+            msg=msg
         )
         time.sleep(1)
 
@@ -6,4 +6,7 @@ DEBUG_PIN = 14  # D5
 MQTT_SERVER = '192.168.2.189'
 MQTT_TOPIC = 'home/temp/outside'
 
+# Either 'json' or the compact 'binary' telemetry format
+PAYLOAD_FORMAT = 'json'
+
 LOG_INTERVAL = 60
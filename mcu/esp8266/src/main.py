@@ -1,5 +1,6 @@
 import json
 import machine
+import struct
 import sys
 import time
 import ubinascii
@@ -12,6 +13,9 @@ import config
 
 CLIENT_ID = ubinascii.hexlify(machine.unique_id())
 
+TELEMETRY_VERSION = 1
+RECORD_THERMOMETER = 2
+
 
 def run():
     connect_wifi()
@@ -45,12 +49,24 @@ def get_sensor_readings():
     bme280 = BME280(i2c=i2c)
     temperature, _, humidity = bme280.read_compensated_data()
 
+    if config.PAYLOAD_FORMAT == 'binary':
+        return struct.pack(
+            '<BBHffff',
+            TELEMETRY_VERSION,
+            RECORD_THERMOMETER,
+            1,
+            temperature,
+            humidity,
+            bme280.heat_index,
+            bme280.dew_point
+        )
+
     return json.dumps({
         'temperature': temperature,
         'humidity': humidity,
         'heat_index': bme280.heat_index,
         'dew_point': bme280.dew_point
-    })
+    }).encode()
 
 
 def publish(msg):
@@ -64,7 +80,7 @@ def publish(msg):
     client.connect()
     client.publish(
         topic=config.MQTT_TOPIC.encode(),
-        msg=msg.encode()
+        msg=msg
     )
     time.sleep(1)
     client.disconnect()
@@ -0,0 +1,399 @@
+import array
+import csv
+import ctypes
+import fcntl
+import math
+import os
+import random
+import struct
+import time
+
+ADC_CHANNELS = (0, 1, 2)
+ADC_MIDPOINT = 2048
+CAPTURE_FORMAT = '<3H'
+EVENT_MAGIC = b'SEIS'
+EVENT_VERSION = 1
+# Magic, version, channels, frame rate, start time, trigger index and frames
+EVENT_HEADER = struct.Struct('<4sBB2xIdII4x')
+
+SPI_IOC_WR_MODE = 0x40016b01
+SPI_TRANSFER_FORMAT = 'QQIIHBBBBBB'
+SPI_TRANSFER_SIZE = struct.calcsize(SPI_TRANSFER_FORMAT)
+SPI_MAX_TRANSFERS = (1 << 14) // SPI_TRANSFER_SIZE - 1
+SPI_MAX_DELAY_US = 0xFFFF
+SPI_CS_CHANGE = 27  # Offset of cs_change within struct spi_ioc_transfer
+MCP3204_MESSAGE_SIZE = 3
+
+
+def _spi_ioc_message(transfers):
+    # _IOW('k', 0, char[transfers * sizeof(struct spi_ioc_transfer)])
+    return (
+        (1 << 30)
+        | ((transfers * SPI_TRANSFER_SIZE) << 16)
+        | (ord('k') << 8)
+    )
+
+
+class GpiozeroMCP3204:
+    """Read the accelerometer through one gpiozero device per channel."""
+
+    def __init__(self, channels=ADC_CHANNELS, max_frames=1):
+        from gpiozero import MCP3204
+
+        self.channels = tuple(channels)
+        self.max_frames = max_frames
+        self.conversion_time = 0.0
+        self._adc = [MCP3204(channel=channel) for channel in channels]
+
+    def read(self):
+        return [adc.raw_value for adc in self._adc]
+
+    def read_frames(self, frames, frame_interval=0):
+        return _read_paced_frames(self, frames, frame_interval)
+
+    def close(self):
+        for adc in self._adc:
+            adc.close()
+
+
+class SpidevMCP3204:
+    """Read every channel of an MCP3204 in a single SPI ioctl.
+
+    Each conversion still needs its own chip select cycle, so one
+    transfer per channel is queued with ``cs_change`` set and the
+    kernel runs the whole message in one transaction. ``read_frames``
+    queues several frames in one message and lets the kernel pace them
+    with the per-transfer delay, filling a preallocated buffer. The
+    returned view is only valid until the next read. ``conversion_time``
+    accumulates the ioctl time of ``read_frames`` minus those delays.
+    """
+
+    def __init__(
+            self,
+            bus=0,
+            device=0,
+            channels=ADC_CHANNELS,
+            speed_hz=1000000,
+            max_frames=1
+    ):
+        if len(channels) * max_frames > SPI_MAX_TRANSFERS:
+            raise ValueError(
+                'At most {} conversions fit in one SPI message'
+                .format(SPI_MAX_TRANSFERS)
+            )
+
+        self.channels = tuple(channels)
+        self.speed_hz = speed_hz
+        self.max_frames = max_frames
+        self.conversion_time = 0.0
+        self._fd = os.open(
+            '/dev/spidev{}.{}'.format(bus, device), os.O_RDWR)
+        fcntl.ioctl(self._fd, SPI_IOC_WR_MODE, struct.pack('B', 0))
+
+        conversions = len(self.channels) * max_frames
+        size = conversions * MCP3204_MESSAGE_SIZE
+        self._tx = (ctypes.c_ubyte * size)()
+        self._rx = (ctypes.c_ubyte * size)()
+        self._transfers = (ctypes.c_ubyte * (
+            conversions * SPI_TRANSFER_SIZE))()
+        self._values = array.array('H', [0] * conversions)
+        self._values_view = memoryview(self._values)
+        self._frame_delay_us = None
+
+        for i in range(conversions):
+            channel = self.channels[i % len(self.channels)]
+            offset = i * MCP3204_MESSAGE_SIZE
+            # Start bit, single-ended mode and channel select
+            self._tx[offset] = 0x06 | ((channel & 0x04) >> 2)
+            self._tx[offset + 1] = (channel & 0x03) << 6
+
+        self._prepare(0)
+
+    def read(self):
+        self._prepare(0)
+
+        return self._transfer(1).tolist()
+
+    def read_frames(self, frames, frame_interval=0):
+        if frames > self.max_frames:
+            raise ValueError(
+                'Cannot read more than {} frames at once'
+                .format(self.max_frames)
+            )
+
+        frame_delay_us = int(frame_interval * 1e6)
+
+        if frame_delay_us > SPI_MAX_DELAY_US:
+            raise ValueError(
+                'Frame interval should be at most {} microseconds'
+                .format(SPI_MAX_DELAY_US)
+            )
+
+        self._prepare(frame_delay_us)
+        start_time = time.perf_counter()
+        values = self._transfer(frames)
+        self.conversion_time += max(
+            0.0,
+            time.perf_counter() - start_time - frames * frame_delay_us / 1e6
+        )
+
+        return values
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _prepare(self, frame_delay_us):
+        if frame_delay_us == self._frame_delay_us:
+            return
+
+        channel_count = len(self.channels)
+        tx_address = ctypes.addressof(self._tx)
+        rx_address = ctypes.addressof(self._rx)
+
+        for i in range(channel_count * self.max_frames):
+            offset = i * MCP3204_MESSAGE_SIZE
+            last_channel = i % channel_count == channel_count - 1
+            struct.pack_into(
+                SPI_TRANSFER_FORMAT,
+                self._transfers,
+                i * SPI_TRANSFER_SIZE,
+                tx_address + offset,
+                rx_address + offset,
+                MCP3204_MESSAGE_SIZE,
+                self.speed_hz,
+                frame_delay_us if last_channel else 0,
+                8,
+                1,
+                0, 0, 0, 0
+            )
+
+        self._frame_delay_us = frame_delay_us
+
+    def _transfer(self, frames):
+        conversions = len(self.channels) * frames
+        # The last transfer must release chip select when the message ends
+        cs_change = (conversions - 1) * SPI_TRANSFER_SIZE + SPI_CS_CHANGE
+        self._transfers[cs_change] = 0
+
+        try:
+            fcntl.ioctl(
+                self._fd,
+                _spi_ioc_message(conversions),
+                self._transfers
+            )
+        finally:
+            self._transfers[cs_change] = 1
+
+        rx = bytes(self._rx)
+
+        for i in range(conversions):
+            offset = i * MCP3204_MESSAGE_SIZE
+            self._values[i] = (
+                ((rx[offset + 1] & 0x0F) << 8) | rx[offset + 2])
+
+        return self._values_view[:conversions]
+
+
+class ReplayADC:
+    """Serve recorded or generated frames in place of the ADC.
+
+    Reads raise ``EOFError`` once every frame has been served, unless
+    ``loop`` is set.
+    """
+
+    def __init__(
+            self,
+            frames,
+            channels=ADC_CHANNELS,
+            max_frames=1,
+            loop=False
+    ):
+        self.channels = tuple(channels)
+        self.max_frames = max_frames
+        self.loop = loop
+        self.conversion_time = 0.0
+        self._frames = frames
+        self._index = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        frames, _ = load_capture(path)
+
+        return cls(frames, **kwargs)
+
+    def read(self):
+        if self._index >= len(self._frames):
+            if not self.loop or not self._frames:
+                raise EOFError('No more frames to replay')
+
+            self._index = 0
+
+        frame = self._frames[self._index]
+        self._index += 1
+
+        return list(frame)
+
+    def read_frames(self, frames, frame_interval=0):
+        values = array.array('H')
+        start_time = time.perf_counter()
+
+        try:
+            for _ in range(frames):
+                values.extend(self.read())
+        except EOFError:
+            if not values:
+                raise
+        finally:
+            self.conversion_time += time.perf_counter() - start_time
+
+        return values
+
+    def close(self):
+        pass
+
+
+class SyntheticADC:
+    """Generate an endless waveform centred on the ADC midpoint.
+
+    ``amplitude`` and ``noise`` are in ADC counts and the waveform is
+    applied to the first channel only.
+    """
+
+    def __init__(
+            self,
+            channels=ADC_CHANNELS,
+            max_frames=1,
+            target_fps=200,
+            waveform='noise',
+            amplitude=0,
+            frequency=1.0,
+            noise=2.0,
+            seed=None
+    ):
+        if waveform not in WAVEFORMS:
+            raise ValueError('Unknown waveform: {}'.format(waveform))
+
+        self.channels = tuple(channels)
+        self.max_frames = max_frames
+        self.conversion_time = 0.0
+        self.target_fps = target_fps
+        self.waveform = waveform
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.noise = noise
+        self._random = random.Random(seed)
+        self._frame = 0
+
+    def read(self):
+        phase = 2 * math.pi * self.frequency * self._frame / self.target_fps
+        self._frame += 1
+
+        if self.waveform == 'sine':
+            signal = self.amplitude * math.sin(phase)
+        elif self.waveform == 'square':
+            signal = self.amplitude * (1 if math.sin(phase) >= 0 else -1)
+        else:
+            signal = 0
+
+        values = []
+
+        for i in range(len(self.channels)):
+            value = ADC_MIDPOINT + self._random.gauss(0, self.noise)
+
+            if i == 0:
+                value += signal
+
+            values.append(min(4095, max(0, round(value))))
+
+        return values
+
+    def read_frames(self, frames, frame_interval=0):
+        return _read_paced_frames(self, frames, frame_interval)
+
+    def close(self):
+        pass
+
+
+def _read_paced_frames(adc, frames, frame_interval):
+    # Only the reads count towards conversion_time, not the pacing sleeps
+    values = array.array('H')
+    target_time = time.monotonic()
+
+    for _ in range(frames):
+        start_time = time.perf_counter()
+        values.extend(adc.read())
+        adc.conversion_time += time.perf_counter() - start_time
+        target_time += frame_interval
+        sleep_time = target_time - time.monotonic()
+
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+
+    return values
+
+
+def load_capture(path):
+    """Load frames and optional reference scales from a capture file.
+
+    CSV captures hold one ``x,y,z`` frame per line, optionally followed by
+    a reference seismic scale. Any other file is read as packed
+    little-endian unsigned 16-bit frames, after skipping the header of
+    waveform event files.
+    """
+    frames = []
+    scales = []
+
+    if path.endswith('.csv'):
+        with open(path, newline='') as capture:
+            for row in csv.reader(capture):
+                if not row or row[0].startswith('#'):
+                    continue
+
+                frames.append(tuple(int(value) for value in row[:3]))
+
+                if len(row) > 3:
+                    scales.append(float(row[3]))
+    else:
+        with open(path, 'rb') as capture:
+            data = capture.read()
+
+        if data.startswith(EVENT_MAGIC):
+            data = data[EVENT_HEADER.size:]
+
+        frames = list(struct.iter_unpack(CAPTURE_FORMAT, data))
+
+    if scales and len(scales) != len(frames):
+        raise ValueError(
+            'Every frame in {} needs a reference scale'.format(path))
+
+    return frames, scales or None
+
+
+def save_capture(path, frames):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as capture:
+            csv.writer(capture).writerows(frames)
+    else:
+        with open(path, 'wb') as capture:
+            for frame in frames:
+                capture.write(struct.pack(CAPTURE_FORMAT, *frame))
+
+
+ADC_BACKENDS = {
+    'gpiozero': GpiozeroMCP3204,
+    'spidev': SpidevMCP3204,
+    'synthetic': SyntheticADC,
+}
+
+WAVEFORMS = ('noise', 'sine', 'square')
+
+
+def open_adc(backend, max_frames=1, target_fps=200):
+    """Open one of ``ADC_BACKENDS`` reading up to ``max_frames`` at once."""
+    if backend == 'synthetic':
+        # The waveform frequency is set in cycles per second of frames
+        return SyntheticADC(max_frames=max_frames, target_fps=target_fps)
+
+    return ADC_BACKENDS[backend](max_frames=max_frames)
@@ -0,0 +1,217 @@
+import collections
+import random
+import time
+
+import click
+
+from adc import ReplayADC
+from adc import SyntheticADC
+from adc import WAVEFORMS
+from adc import load_capture
+from seismometer import BlockScaleCalculator
+from seismometer import JMAScaleCalculator
+from seismometer import ScaleCalculator
+from sliding_window import OrderStatisticWindow
+
+
+@click.group()
+def cmd():
+    pass
+
+
+@cmd.command()
+@click.option('--fps', '-f', default=200)
+@click.option('--seconds', '-s', default=60)
+@click.option('--window', '-w', default=5.0)
+def percentile(fps, seconds, window):
+    frames = fps * seconds
+    window_size = int(fps * window)
+    rank = int(fps * 0.3)
+    samples = [abs(random.gauss(0, 1)) for _ in range(frames)]
+
+    def _sort_per_frame():
+        values = collections.deque(maxlen=window_size)
+        results = []
+
+        for sample in samples:
+            values.append(sample)
+
+            try:
+                results.append(sorted(values)[-rank])
+            except IndexError:
+                pass
+
+        return results
+
+    def _order_statistic_window():
+        values = OrderStatisticWindow(size=window_size, rank=rank)
+        results = []
+
+        for sample in samples:
+            values.append(sample)
+
+            try:
+                results.append(values.kth_largest())
+            except IndexError:
+                pass
+
+        return results
+
+    expected = None
+
+    for name, function in (
+            ('sort-per-frame', _sort_per_frame),
+            ('order-statistic-window', _order_statistic_window),
+    ):
+        start_time = time.perf_counter()
+        results = function()
+        elapsed = time.perf_counter() - start_time
+
+        if expected is None:
+            expected = results
+        elif results != expected:
+            raise click.ClickException(
+                '{} results differ from sort-per-frame'.format(name))
+
+        click.echo(
+            '{:<24} {:>10.3f} us/frame {:>8.2f}% CPU'.format(
+                name,
+                elapsed / frames * 1e6,
+                elapsed / seconds * 100
+            )
+        )
+
+
+@cmd.command()
+@click.option('--fps', '-f', default=200)
+@click.option('--seconds', '-s', default=60)
+@click.option('--block-frames', '-b', default=20)
+def engines(fps, seconds, block_frames):
+    frames = fps * seconds
+    samples = [
+        [2048 + round(random.gauss(0, 2)) for _ in range(3)]
+        for _ in range(frames)
+    ]
+    blocks = [
+        samples[i:i + block_frames]
+        for i in range(0, frames, block_frames)
+    ]
+
+    def _per_frame(calculator):
+        for sample in samples:
+            calculator.update(sample)
+
+    def _per_block(calculator):
+        for block in blocks:
+            calculator.update_block(block)
+
+    for name, calculator_class, function in (
+            ('simple', ScaleCalculator, _per_frame),
+            ('simple-vectorized', BlockScaleCalculator, _per_block),
+            ('jma', JMAScaleCalculator, _per_block),
+    ):
+        calculator = calculator_class(target_fps=fps)
+        start_time = time.perf_counter()
+        function(calculator)
+        elapsed = time.perf_counter() - start_time
+
+        click.echo(
+            '{:<24} {:>10.3f} ms per second of signal {:>8.2f}% CPU'.format(
+                name,
+                elapsed / seconds * 1e3,
+                elapsed / seconds * 100
+            )
+        )
+
+
+@cmd.command()
+@click.argument(
+    'captures', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--fps', '-f', default=200)
+@click.option('--seconds', '-s', default=60)
+@click.option('--block-frames', '-b', default=20)
+@click.option('--waveform', type=click.Choice(WAVEFORMS), default='sine')
+@click.option('--amplitude', default=50.0)
+def replay(captures, fps, seconds, block_frames, waveform, amplitude):
+    recordings = []
+
+    for capture in captures:
+        frames, scales = load_capture(capture)
+        recordings.append((capture, frames, scales))
+
+    if not recordings:
+        source = SyntheticADC(
+            target_fps=fps,
+            waveform=waveform,
+            amplitude=amplitude,
+            seed=0
+        )
+        frames = [source.read() for _ in range(fps * seconds)]
+        recordings.append(('synthetic-{}'.format(waveform), frames, None))
+
+    for name, frames, scales in recordings:
+        click.echo('{} ({} frames)'.format(name, len(frames)))
+
+        for engine, calculator_class, frames_per_read in (
+                ('simple', ScaleCalculator, 1),
+                ('simple-vectorized', BlockScaleCalculator, block_frames),
+                ('jma', JMAScaleCalculator, block_frames),
+        ):
+            source = ReplayADC(frames, max_frames=frames_per_read)
+            calculator = calculator_class(target_fps=fps)
+            read_time = 0
+            calculate_time = 0
+            results = []
+
+            while True:
+                start_time = time.perf_counter()
+
+                try:
+                    if frames_per_read == 1:
+                        values = source.read()
+                    else:
+                        values = source.read_frames(frames_per_read)
+                except EOFError:
+                    break
+
+                read_end_time = time.perf_counter()
+
+                if frames_per_read == 1:
+                    results.append(calculator.update(values))
+                else:
+                    results.extend(calculator.update_block(values)[0])
+
+                read_time += read_end_time - start_time
+                calculate_time += time.perf_counter() - read_end_time
+
+            elapsed = read_time + calculate_time
+            line = (
+                '  {:<20} {:>10.0f} frames/s read {:>7.2f} us '
+                'calculate {:>7.2f} us (filter {:>7.2f} us '
+                'percentile {:>7.2f} us)'
+            ).format(
+                engine,
+                len(frames) / elapsed,
+                read_time / len(frames) * 1e6,
+                calculate_time / len(frames) * 1e6,
+                calculator.filter_time / len(frames) * 1e6,
+                calculator.percentile_time / len(frames) * 1e6
+            )
+
+            if scales is not None:
+                errors = [
+                    abs(result - scale)
+                    for result, scale in zip(results, scales)
+                ]
+                line += ' error mean {:.4f} max {:.4f}'.format(
+                    sum(errors) / len(errors), max(errors))
+
+            click.echo(line)
+
+
+def main():
+    cmd()
+
+
+if __name__ == '__main__':
+    main()
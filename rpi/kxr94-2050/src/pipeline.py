@@ -0,0 +1,114 @@
+import array
+import collections
+import threading
+import time
+
+
+class BlockPipeline:
+    """Acquire fixed-size sample blocks on a dedicated thread.
+
+    Blocks are preallocated and cycle between a free list and a bounded
+    ring of filled blocks. The acquisition thread never waits for the
+    consumer: when the ring is full the oldest unprocessed block is
+    dropped and reused. ``read_time`` only counts the ADC conversions,
+    while ``block_wait_time`` is the wall time spent filling blocks,
+    frame pacing included.
+    """
+
+    def __init__(self, adc, block_frames, frame_interval, capacity=8):
+        if capacity < 2:
+            raise ValueError('Pipeline capacity should be at least 2 blocks')
+
+        self.adc = adc
+        self.block_frames = block_frames
+        self.frame_interval = frame_interval
+        self.capacity = capacity
+
+        block_size = block_frames * len(adc.channels)
+        self._free = collections.deque(
+            memoryview(array.array('H', [0] * block_size))
+            for _ in range(capacity)
+        )
+        self._filled = collections.deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self._blocks_acquired = 0
+        self._blocks_processed = 0
+        self._blocks_dropped = 0
+        self._overruns = 0
+        self._max_backlog = 0
+        self._read_time = 0.0
+        self._block_wait_time = 0.0
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._acquire)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        with self._condition:
+            self._condition.notify_all()
+
+        self._thread.join()
+        self._thread = None
+
+    def get(self, timeout=None):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._filled or self._stopped.is_set(), timeout)
+
+            if not self._filled:
+                return None
+
+            return self._filled.popleft()
+
+    def release(self, block):
+        with self._condition:
+            self._free.append(block)
+            self._blocks_processed += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'blocks_acquired': self._blocks_acquired,
+                'blocks_processed': self._blocks_processed,
+                'blocks_dropped': self._blocks_dropped,
+                'overruns': self._overruns,
+                'backlog': len(self._filled),
+                'max_backlog': self._max_backlog,
+                'read_time': self._read_time,
+                'block_wait_time': self._block_wait_time,
+            }
+
+    def _acquire(self):
+        block_time = self.block_frames * self.frame_interval
+        overrun_time = block_time + self.frame_interval
+
+        while not self._stopped.is_set():
+            with self._condition:
+                if self._free:
+                    block = self._free.popleft()
+                else:
+                    block = self._filled.popleft()
+                    self._blocks_dropped += 1
+
+            conversion_time = self.adc.conversion_time
+            start_time = time.monotonic()
+            block[:] = self.adc.read_frames(
+                self.block_frames, self.frame_interval)
+            block_wait_time = time.monotonic() - start_time
+
+            with self._condition:
+                if block_wait_time > overrun_time:
+                    self._overruns += 1
+
+                self._read_time += self.adc.conversion_time - conversion_time
+                self._block_wait_time += block_wait_time
+                self._filled.append(block)
+                self._blocks_acquired += 1
+                self._max_backlog = max(self._max_backlog, len(self._filled))
+                self._condition.notify()
@@ -0,0 +1,174 @@
+import collections
+import logging
+import math
+import threading
+import time
+
+from telemetry import encode_json
+
+
+class BatchPublisher:
+    """Publish readings to MQTT from a worker thread.
+
+    ``put`` never blocks: readings queue up in a bounded backlog that
+    drops the oldest reading when full. The worker sends at most
+    ``max_rate`` messages per second, coalescing up to ``max_batch``
+    readings into one payload built by ``encode``.
+    """
+
+    def __init__(
+            self,
+            client,
+            topic,
+            max_rate=10.0,
+            max_batch=1,
+            backlog=1000,
+            encode=encode_json
+    ):
+        self.client = client
+        self.topic = topic
+        self.max_rate = max_rate
+        self.max_batch = max_batch
+        self.encode = encode
+        self._backlog = collections.deque(maxlen=backlog)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+        self._readings_published = 0
+        self._messages_published = 0
+        self._readings_dropped = 0
+        self._bytes_published = 0
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._publish, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        self._thread.join()
+
+    def put(self, reading):
+        with self._condition:
+            if len(self._backlog) == self._backlog.maxlen:
+                self._readings_dropped += 1
+
+            self._backlog.append(reading)
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'readings_published': self._readings_published,
+                'messages_published': self._messages_published,
+                'readings_dropped': self._readings_dropped,
+                'bytes_published': self._bytes_published,
+                'backlog': len(self._backlog),
+            }
+
+    def _publish(self):
+        min_interval = 1.0 / self.max_rate if self.max_rate else 0
+        next_publish_time = time.monotonic()
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._backlog or self._stopped)
+
+                if self._stopped and not self._backlog:
+                    return
+
+            # Let readings accumulate until the rate limit allows a message
+            delay = next_publish_time - time.monotonic()
+
+            if delay > 0 and not self._stopped:
+                time.sleep(delay)
+
+            with self._condition:
+                batch = [
+                    self._backlog.popleft()
+                    for _ in range(min(self.max_batch, len(self._backlog)))
+                ]
+
+            message = self.encode(batch)
+            self.client.publish(self.topic, message)
+            logging.debug('Published message: %s', message)
+            next_publish_time = time.monotonic() + min_interval
+
+            with self._condition:
+                self._readings_published += len(batch)
+                self._messages_published += 1
+                self._bytes_published += len(message)
+
+
+class ReportByException:
+    """Pick the seismic readings worth publishing.
+
+    A reading is reported as soon as its scale moves more than
+    ``deadband`` away from the last reported scale or its intensity class
+    changes. Every ``heartbeat`` seconds the latest reading is reported
+    regardless, along with the minimum, maximum and mean scale of every
+    reading seen since the previous heartbeat.
+    """
+
+    def __init__(self, deadband, heartbeat=60.0):
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self._last_scale = None
+        self._last_class = None
+        self._readings = 0
+        self._reported = 0
+        self._heartbeats = 0
+        self._start_summary(time.monotonic())
+
+    def update(self, reading, intensity_class):
+        now = time.monotonic()
+        scale = reading['seismic_scale']
+        self._readings += 1
+        self._summary_count += 1
+        self._summary_total += scale
+        self._summary_min = min(self._summary_min, scale)
+        self._summary_max = max(self._summary_max, scale)
+
+        if now >= self._next_heartbeat:
+            report = dict(reading)
+            report.update({
+                'min_seismic_scale': self._summary_min,
+                'max_seismic_scale': self._summary_max,
+                'mean_seismic_scale': (
+                    self._summary_total / self._summary_count),
+            })
+            self._heartbeats += 1
+            self._start_summary(now)
+        elif (
+                self._last_scale is None
+                or abs(scale - self._last_scale) > self.deadband
+                or intensity_class != self._last_class
+        ):
+            report = reading
+        else:
+            return None
+
+        self._last_scale = scale
+        self._last_class = intensity_class
+        self._reported += 1
+
+        return report
+
+    def stats(self):
+        return {
+            'readings': self._readings,
+            'reported': self._reported,
+            'heartbeats': self._heartbeats,
+        }
+
+    def _start_summary(self, now):
+        self._next_heartbeat = now + self.heartbeat
+        self._summary_count = 0
+        self._summary_total = 0.0
+        self._summary_min = math.inf
+        self._summary_max = -math.inf
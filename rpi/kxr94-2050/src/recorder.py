@@ -0,0 +1,230 @@
+import datetime
+import mmap
+import os
+import struct
+import time
+
+from adc import EVENT_HEADER
+from adc import EVENT_MAGIC
+from adc import EVENT_VERSION
+
+RING_HEADER = struct.Struct('<Q')
+RING_FILE = 'waveform.ring'
+
+
+class WaveformRecorder:
+    """Keep the latest raw frames in a memory-mapped ring file.
+
+    The ring file is preallocated for ``retention`` seconds of frames and
+    its header holds the number of frames ever written. ``trigger`` marks
+    an event: once ``post_event`` seconds of frames have followed the
+    last trigger, the frames from ``pre_event`` seconds before the first
+    trigger onwards are frozen into an event file next to the ring.
+    """
+
+    def __init__(
+            self,
+            directory,
+            target_fps,
+            channels=3,
+            retention=60.0,
+            pre_event=10.0,
+            post_event=30.0
+    ):
+        if pre_event + post_event >= retention:
+            raise ValueError(
+                'Retention should be longer than the event window')
+
+        self.directory = directory
+        self.target_fps = target_fps
+        self.channels = channels
+        self.capacity = int(retention * target_fps)
+        self.pre_frames = int(pre_event * target_fps)
+        self.post_frames = int(post_event * target_fps)
+
+        size = RING_HEADER.size + self.capacity * channels * 2
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, RING_FILE), 'w+b') as ring:
+            ring.truncate(size)
+            self._mmap = mmap.mmap(ring.fileno(), size)
+
+        self._buffer = memoryview(self._mmap)
+        self._values = self._buffer[RING_HEADER.size:].cast('H')
+        self._written = 0
+        self._last_write_time = None
+        self._event = None
+        self._events = 0
+
+    @property
+    def written(self):
+        return self._written
+
+    def append(self, frame):
+        offset = (self._written % self.capacity) * self.channels
+
+        for i in range(self.channels):
+            self._values[offset + i] = frame[i]
+
+        self._advance(1)
+
+    def extend(self, samples):
+        samples = memoryview(samples)
+        frames = len(samples) // self.channels
+        position = 0
+
+        # Split writes that wrap around the end of the ring
+        while position < frames:
+            index = (self._written + position) % self.capacity
+            count = min(frames - position, self.capacity - index)
+            self._values[
+                index * self.channels:(index + count) * self.channels
+            ] = samples[
+                position * self.channels:(position + count) * self.channels
+            ]
+            position += count
+
+        self._advance(frames)
+
+    def trigger(self, position=None):
+        if position is None:
+            position = self._written - 1
+
+        if position < 0:
+            return
+
+        end = position + 1 + self.post_frames
+
+        if self._event is None:
+            start = max(
+                0,
+                self._written - self.capacity,
+                position - self.pre_frames
+            )
+            self._event = [start, position, end]
+        else:
+            # Keep extending the event while it still fits in the ring
+            start = self._event[0]
+            self._event[2] = min(
+                max(self._event[2], end), start + self.capacity)
+
+    def stats(self):
+        return {
+            'written': self._written,
+            'events': self._events,
+            'pending': self._event is not None,
+        }
+
+    def close(self):
+        if self._event is not None:
+            self._freeze(min(self._event[2], self._written))
+
+        self._values.release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def _advance(self, frames):
+        self._written += frames
+        self._last_write_time = time.time()
+        RING_HEADER.pack_into(self._mmap, 0, self._written)
+
+        if self._event is not None and self._written >= self._event[2]:
+            self._freeze(self._event[2])
+
+    def _freeze(self, end):
+        start, trigger, _ = self._event
+        self._event = None
+        # Frames written since the event ended belong to the next one
+        start = max(start, self._written - self.capacity)
+        start_time = (
+            self._last_write_time
+            - (self._written - start) / self.target_fps
+        )
+        header = EVENT_HEADER.pack(
+            EVENT_MAGIC,
+            EVENT_VERSION,
+            self.channels,
+            self.target_fps,
+            start_time,
+            trigger - start,
+            end - start
+        )
+        name = 'event-{:%Y%m%d-%H%M%S-%f}.seis'.format(
+            datetime.datetime.fromtimestamp(
+                start_time + (trigger - start) / self.target_fps))
+
+        with open(os.path.join(self.directory, name), 'wb') as event:
+            event.write(header)
+            first = start % self.capacity
+            last = first + end - start
+
+            if last <= self.capacity:
+                event.write(
+                    self._values[
+                        first * self.channels:last * self.channels])
+            else:
+                event.write(self._values[first * self.channels:])
+                event.write(
+                    self._values[
+                        :(last - self.capacity) * self.channels])
+
+        self._events += 1
+
+
+class WaveformEvent:
+    """Memory-map an event file written by ``WaveformRecorder``.
+
+    ``samples`` is a flat view of the interleaved channel values that
+    shares memory with the file, e.g. for ``numpy.frombuffer``.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as event:
+            self._mmap = mmap.mmap(
+                event.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.channels,
+            self.target_fps,
+            self.start_time,
+            self.trigger_index,
+            frames
+        ) = EVENT_HEADER.unpack_from(self._mmap)
+
+        if magic != EVENT_MAGIC or version != EVENT_VERSION:
+            self._mmap.close()
+            raise ValueError('{} is not a waveform event file'.format(path))
+
+        self._buffer = memoryview(self._mmap)
+        self.samples = self._buffer[
+            EVENT_HEADER.size:
+            EVENT_HEADER.size + frames * self.channels * 2
+        ].cast('H')
+
+    @property
+    def trigger_time(self):
+        return self.start_time + self.trigger_index / self.target_fps
+
+    def __len__(self):
+        return len(self.samples) // self.channels
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError('Frame index out of range')
+
+        offset = index * self.channels
+
+        return tuple(self.samples[offset:offset + self.channels])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.samples.release()
+        self._buffer.release()
+        self._mmap.close()
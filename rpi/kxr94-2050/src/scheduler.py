@@ -0,0 +1,96 @@
+import logging
+import time
+
+CATCH_UP_POLICIES = ('compress', 'skip', 'log')
+LATENESS_BINS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)  # us
+
+
+class FrameScheduler:
+    """Pace a loop at a fixed frame interval on a monotonic clock.
+
+    ``wait`` sleeps until the next frame is due, optionally spinning for
+    the final ``spin`` seconds, and records how late each frame started.
+    When a frame overruns, ``catch_up`` decides what happens next:
+    ``compress`` runs the missed frames back to back, ``skip`` drops
+    them and stays on the original time grid, and ``log`` warns and
+    restarts the grid from the current time.
+    """
+
+    def __init__(self, frame_interval, spin=0.0, catch_up='compress'):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError('Unknown catch-up policy: {}'.format(catch_up))
+
+        self.frame_interval = frame_interval
+        self.spin = spin
+        self.catch_up = catch_up
+        self.reset()
+
+    def reset(self):
+        self._start_time = time.perf_counter()
+        self._target_time = self._start_time
+        self._frames = 0
+        self._overruns = 0
+        self._skipped_frames = 0
+        self._total_lateness = 0
+        self._max_lateness = 0
+        self._histogram = [0] * (len(LATENESS_BINS) + 1)
+
+    def wait(self):
+        self._target_time += self.frame_interval
+        now = time.perf_counter()
+        remaining = self._target_time - now
+
+        if remaining > 0:
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+
+            while time.perf_counter() < self._target_time:
+                pass
+
+            self._record(time.perf_counter() - self._target_time)
+            return
+
+        # Record the real lateness before catching up moves the time grid
+        self._record(-remaining)
+
+        if -remaining >= self.frame_interval:
+            self._overruns += 1
+
+            if self.catch_up == 'skip':
+                missed = int(-remaining // self.frame_interval)
+                self._skipped_frames += missed
+                self._target_time += missed * self.frame_interval
+            elif self.catch_up == 'log':
+                logging.warning(
+                    'Frame overran by %.2f ms', -remaining * 1e3)
+                self._target_time = now
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._start_time
+        histogram = list(self._histogram)
+
+        return {
+            'frames': self._frames,
+            'overruns': self._overruns,
+            'skipped_frames': self._skipped_frames,
+            'mean_lateness': self._total_lateness / max(1, self._frames),
+            'max_lateness': self._max_lateness,
+            'effective_rate': self._frames / elapsed if elapsed else 0,
+            # The last bin has no upper bound
+            'lateness_histogram': list(
+                zip(LATENESS_BINS + (None,), histogram)),
+        }
+
+    def _record(self, lateness):
+        self._frames += 1
+        self._total_lateness += lateness
+        self._max_lateness = max(self._max_lateness, lateness)
+
+        lateness_us = lateness * 1e6
+
+        for i, upper_bound in enumerate(LATENESS_BINS):
+            if lateness_us < upper_bound:
+                self._histogram[i] += 1
+                break
+        else:
+            self._histogram[-1] += 1
@@ -20,11 +20,11 @@
 # SOFTWARE.
 
 import atexit
-import collections
 import datetime
 import json
 import logging
 import math
+import multiprocessing
 import sys
 import threading
 import time
@@ -35,14 +35,50 @@ import paho.mqtt.client as mqtt
 from gpiozero import Buzzer
 from gpiozero import LED
 from gpiozero import LEDBoard
-from gpiozero import MCP3204
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from adc import ADC_BACKENDS
+from adc import ReplayADC
+from adc import open_adc
+from adc import save_capture
+from pipeline import BlockPipeline
+from publisher import BatchPublisher
+from publisher import ReportByException
+from recorder import WaveformRecorder
+from scheduler import CATCH_UP_POLICIES
+from scheduler import FrameScheduler
+from shared_ring import SharedRing
+from sliding_window import MovingAverage
+from sliding_window import OrderStatisticWindow
+from telemetry import PAYLOAD_ENCODERS
+from trigger import StaLtaTrigger
+from trigger import TRIGGERS
 
 ADC_TO_GAL = 1.13426
 
 TARGET_FPS = 200
 ACCEL_FRAME = int(TARGET_FPS * 0.3)
-LOOP_DELTA = 1.0 / TARGET_FPS
+ACCEL_WINDOW = 5  # seconds
+ADC_BACKEND = 'spidev'
+PIPELINE_CAPACITY = 8  # blocks
+JMA_FILTER_LENGTH = 5.12  # seconds
+ENGINES = ('simple', 'jma')
+SMOOTHING_DECAY = 0.94  # per frame at TARGET_FPS
 MAX_32_BIT_INT = 2147483647
+ALERT_SCALE = 3.5
+RING_SECONDS = 10
+RING_POLL_INTERVAL = 0.01  # seconds
+WAVEFORM_RETENTION = 60  # seconds
+PRE_EVENT = 10  # seconds
+POST_EVENT = 30  # seconds
+STA_WINDOW = 1  # seconds
+LTA_WINDOW = 30  # seconds
+TRIGGER_ON_RATIO = 3.0
+TRIGGER_OFF_RATIO = 1.5
 
 SCALE_LED_CHARSETS = {
     '0': (0, 0, 0, 0, 0, 0, 0, 0),
@@ -75,37 +111,590 @@ class Singleton(type):
         return cls._instances[cls]
 
 
-class Seismometer(metaclass=Singleton):
-    def __init__(self):
-        self._adc = [
-            MCP3204(channel=0),
-            MCP3204(channel=1),
-            MCP3204(channel=2)
+class ScaleCalculator:
+    def __init__(
+            self,
+            target_fps=TARGET_FPS,
+            accel_frame=None,
+            accel_window=ACCEL_WINDOW
+    ):
+        if accel_frame is None:
+            accel_frame = int(target_fps * 0.3)
+
+        if accel_frame > target_fps * accel_window:
+            raise ValueError(
+                'Acceleration frame should not exceed acceleration window')
+
+        # Keep the smoothing time constant independent of the frame rate
+        self._decay = SMOOTHING_DECAY ** (TARGET_FPS / target_fps)
+        self._xyz_adc = [
+            MovingAverage(target_fps, compact=True),
+            MovingAverage(target_fps, compact=True),
+            MovingAverage(target_fps, compact=True)
         ]
+        self._xyz_gals = [0, 0, 0]
+        self._accel_values = OrderStatisticWindow(
+            size=int(target_fps * accel_window),
+            rank=accel_frame
+        )
+        self.xyz_accel = [0, 0, 0]
+        self.seismic_scale = 0
+        self.filter_time = 0.0
+        self.percentile_time = 0.0
+
+    def update(self, adc_values):
+        start_time = time.perf_counter()
+        decay = self._decay
+
+        for i in range(3):
+            adc_val = adc_values[i]
+            self._xyz_adc[i].append(adc_val)
+
+            offset = self._xyz_adc[i].mean
+            self._xyz_gals[i] = (
+                self._xyz_gals[i] * decay + adc_val * (1 - decay))
+            self.xyz_accel[i] = (self._xyz_gals[i] - offset) * ADC_TO_GAL
+
+        filtered_time = time.perf_counter()
+        self._accel_values.append(
+            self._calculate_composite_acceleration(self.xyz_accel))
+
+        try:
+            continous_accel = self._accel_values.kth_largest()
+
+            if continous_accel > 0:
+                self.seismic_scale = 2 * math.log10(continous_accel) + 0.94
+            else:
+                self.seismic_scale = 0
+        except IndexError:
+            pass
+
+        self.filter_time += filtered_time - start_time
+        self.percentile_time += time.perf_counter() - filtered_time
+
+        return self.seismic_scale
+
+    @classmethod
+    def _calculate_composite_acceleration(cls, xyz_accel):
+        return math.sqrt(
+            (xyz_accel[0] ** 2)
+            + (xyz_accel[1] ** 2)
+            + (xyz_accel[2] ** 2)
+        )
+
+
+class BlockScaleCalculator:
+    """NumPy counterpart of ScaleCalculator working on blocks of frames.
+
+    Smoothing, offset removal, composite acceleration and the scale of
+    every frame in a block are computed as array operations.
+    """
+
+    def __init__(
+            self,
+            target_fps=TARGET_FPS,
+            accel_frame=None,
+            accel_window=ACCEL_WINDOW
+    ):
+        if numpy is None:
+            raise RuntimeError('NumPy is required for block processing')
+
+        if accel_frame is None:
+            accel_frame = int(target_fps * 0.3)
+
+        if accel_frame > target_fps * accel_window:
+            raise ValueError(
+                'Acceleration frame should not exceed acceleration window')
+
+        self._decay = SMOOTHING_DECAY ** (TARGET_FPS / target_fps)
+        self._offset_frames = target_fps
+        self._accel_frame = accel_frame
+        self._accel_size = int(target_fps * accel_window)
+        self._adc_history = numpy.zeros((0, 3))
+        self._accel_history = numpy.full(self._accel_size - 1, -numpy.inf)
+        self._xyz_gals = numpy.zeros(3)
+        self._smoothing_filters = {}
+        self.xyz_accel = [0, 0, 0]
+        self.seismic_scale = 0
+        self.filter_time = 0.0
+        self.percentile_time = 0.0
+
+    def update(self, adc_values):
+        self.update_block(adc_values)
+
+        return self.seismic_scale
+
+    def update_block(self, adc_block):
+        start_time = time.perf_counter()
+        adc = numpy.asarray(adc_block, dtype=float).reshape(-1, 3)
+
+        smoothing, decay_powers = self._smoothing_filter(len(adc))
+        xyz_gals = smoothing @ adc + numpy.outer(decay_powers, self._xyz_gals)
+        self._xyz_gals = xyz_gals[-1]
+
+        xyz_accel = (xyz_gals - self._update_offsets(adc)) * ADC_TO_GAL
+        self.filter_time += time.perf_counter() - start_time
+
+        return self._update_scales(xyz_accel), xyz_accel
+
+    def _update_offsets(self, adc):
+        frames = len(adc)
+        history = numpy.concatenate((self._adc_history, adc))
+        sums = numpy.concatenate((numpy.zeros((1, 3)), history.cumsum(axis=0)))
+        ends = numpy.arange(len(history) - frames + 1, len(history) + 1)
+        starts = numpy.maximum(ends - self._offset_frames, 0)
+        self._adc_history = history[
+            max(0, len(history) - self._offset_frames + 1):]
+
+        return (sums[ends] - sums[starts]) / (ends - starts)[:, None]
+
+    def _update_scales(self, xyz_accel):
+        start_time = time.perf_counter()
+        accel_values = numpy.concatenate((
+            self._accel_history,
+            numpy.sqrt((xyz_accel ** 2).sum(axis=1))
+        ))
+        continous_accel = self._kth_largest_per_window(
+            accel_values, len(xyz_accel))
+        self._accel_history = accel_values[
+            len(accel_values) - self._accel_size + 1:]
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scales = numpy.where(
+                continous_accel > 0,
+                2 * numpy.log10(continous_accel) + 0.94,
+                0
+            )
+
+        # Keep the previous scale until the window holds enough values
+        scales[numpy.isneginf(continous_accel)] = self.seismic_scale
+
+        self.xyz_accel = xyz_accel[-1].tolist()
+        self.seismic_scale = float(scales[-1])
+        self.percentile_time += time.perf_counter() - start_time
+
+        return scales
+
+    def _kth_largest_per_window(self, accel_values, frames):
+        size = self._accel_size
+        rank = self._accel_frame
+
+        # Values shared by every window in the block bound each answer from
+        # below, so only values above that bound need to be partitioned.
+        shared = accel_values[frames - 1:size]
+
+        if len(shared) >= rank:
+            bound = numpy.partition(shared, -rank)[-rank]
+            positions = numpy.flatnonzero(accel_values >= bound)
+        else:
+            positions = numpy.arange(len(accel_values))
+
+        window_starts = numpy.arange(frames)
+        starts = numpy.searchsorted(positions, window_starts)
+        ends = numpy.searchsorted(positions, window_starts + size)
+        indices = starts[:, None] + numpy.arange((ends - starts).max())
+        candidates = numpy.where(
+            indices < ends[:, None],
+            accel_values[positions.take(indices, mode='clip')],
+            -numpy.inf
+        )
+
+        return numpy.partition(candidates, -rank, axis=1)[:, -rank]
+
+    def _smoothing_filter(self, frames):
+        if frames not in self._smoothing_filters:
+            indices = numpy.arange(frames)
+            lags = numpy.subtract.outer(indices, indices)
+            smoothing = numpy.where(
+                lags >= 0,
+                (1 - self._decay) * self._decay ** numpy.maximum(lags, 0),
+                0
+            )
+            decay_powers = self._decay ** numpy.arange(1, frames + 1)
+            self._smoothing_filters[frames] = (smoothing, decay_powers)
+
+        return self._smoothing_filters[frames]
+
+
+class JMAScaleCalculator(BlockScaleCalculator):
+    """Scale following the JMA instrumental seismic intensity method.
+
+    Each axis is passed through the JMA period-effect, high-cut and
+    low-cut filters, realised as a linear-phase FIR filter applied by
+    overlap-add with real FFTs. The scale is then taken from the
+    filtered composite acceleration as in the simple engine, lagging
+    the signal by half the filter length.
+    """
+
+    def __init__(
+            self,
+            target_fps=TARGET_FPS,
+            accel_frame=None,
+            accel_window=ACCEL_WINDOW,
+            filter_length=JMA_FILTER_LENGTH,
+            hop_frames=None
+    ):
+        super().__init__(target_fps, accel_frame, accel_window)
+
+        taps = 2 ** round(math.log2(target_fps * filter_length))
+        self._filter = jma_filter_taps(taps, target_fps)
+        self._filter_responses = {}
+        self._tail = numpy.zeros((taps - 1, 3))
+        self._hop_frames = hop_frames or max(1, target_fps // 10)
+        self._pending = []
+        self._baseline = None
+
+    def update(self, adc_values):
+        self._pending.append(adc_values)
+
+        if len(self._pending) >= self._hop_frames:
+            self.update_block(self._pending)
+            self._pending = []
+
+        return self.seismic_scale
+
+    def update_block(self, adc_block):
+        start_time = time.perf_counter()
+        adc = numpy.asarray(adc_block, dtype=float).reshape(-1, 3)
+        frames = len(adc)
+        taps = len(self._filter)
+        fft_size = 2 ** math.ceil(math.log2(frames + taps - 1))
+
+        response = self._filter_responses.get(fft_size)
+
+        if response is None:
+            response = numpy.fft.rfft(self._filter, fft_size)[:, None]
+            self._filter_responses[fft_size] = response
+
+        # The low-cut filter rejects the offset itself; subtracting the
+        # first reading only avoids a start-up transient.
+        if self._baseline is None:
+            self._baseline = adc[0].copy()
+
+        accel = (adc - self._baseline) * ADC_TO_GAL
+        filtered = numpy.fft.irfft(
+            numpy.fft.rfft(accel, fft_size, axis=0) * response,
+            fft_size,
+            axis=0
+        )[:frames + taps - 1]
+        filtered[:taps - 1] += self._tail
+        self._tail = filtered[frames:]
+        xyz_accel = filtered[:frames]
+        self.filter_time += time.perf_counter() - start_time
+
+        return self._update_scales(xyz_accel), xyz_accel
+
+
+def jma_filter_response(frequencies):
+    frequencies = numpy.asarray(frequencies, dtype=float)
+    x = frequencies / 10
+
+    with numpy.errstate(divide='ignore'):
+        period_effect = numpy.where(
+            frequencies > 0, 1 / numpy.sqrt(frequencies), 0)
+
+    high_cut = (
+        1
+        + 0.694 * x ** 2
+        + 0.241 * x ** 4
+        + 0.0557 * x ** 6
+        + 0.009664 * x ** 8
+        + 0.00134 * x ** 10
+        + 0.000155 * x ** 12
+    ) ** -0.5
+    low_cut = numpy.sqrt(1 - numpy.exp(-(frequencies / 0.5) ** 3))
+
+    return period_effect * high_cut * low_cut
+
+
+def jma_filter_taps(taps, sample_rate):
+    response = jma_filter_response(numpy.fft.rfftfreq(taps, 1 / sample_rate))
+    window = numpy.hanning(taps)
+    impulse = numpy.roll(numpy.fft.irfft(response, taps), taps // 2) * window
+
+    # Windowing leaks a little DC gain that the low-cut filter should reject
+    return impulse - window * impulse.sum() / window.sum()
+
+
+class Seismometer(metaclass=Singleton):
+    def __init__(
+            self,
+            target_fps=TARGET_FPS,
+            accel_frame=None,
+            accel_window=ACCEL_WINDOW,
+            adc=ADC_BACKEND,
+            block_frames=None,
+            pipeline_capacity=PIPELINE_CAPACITY,
+            vectorized=False,
+            engine='simple',
+            spin=0.0,
+            catch_up='compress',
+            isolated=False,
+            waveform_dir=None,
+            waveform_retention=WAVEFORM_RETENTION,
+            pre_event=PRE_EVENT,
+            post_event=POST_EVENT,
+            trigger='alert',
+            sta=STA_WINDOW,
+            lta=LTA_WINDOW,
+            trigger_on=TRIGGER_ON_RATIO,
+            trigger_off=TRIGGER_OFF_RATIO
+    ):
+        if accel_frame is None:
+            accel_frame = int(target_fps * 0.3)
+
+        if engine not in ENGINES:
+            raise ValueError('Unknown engine: {}'.format(engine))
+
+        if trigger not in TRIGGERS:
+            raise ValueError('Unknown trigger: {}'.format(trigger))
+
+        if vectorized and not block_frames:
+            raise ValueError('Vectorized processing requires block frames')
+
+        self.target_fps = target_fps
+        self.accel_frame = accel_frame
+        self.accel_window = accel_window
+        self.block_frames = block_frames
+        self.pipeline_capacity = pipeline_capacity
+        self.vectorized = vectorized
+        self.engine = engine
+        self.isolated = isolated
+        self.waveform_dir = waveform_dir
+        self.waveform_retention = waveform_retention
+        self.pre_event = pre_event
+        self.post_event = post_event
+        self.trigger = trigger
+        self.sta = sta
+        self.lta = lta
+        self.trigger_on = trigger_on
+        self.trigger_off = trigger_off
+        self._calculator = self._create_calculator()
+
+        if isolated:
+            # The acquisition process owns the ADC
+            self._adc = None
+            self._isolated_kwargs = {
+                'target_fps': target_fps,
+                'accel_frame': accel_frame,
+                'accel_window': accel_window,
+                'adc': adc,
+                'block_frames': block_frames,
+                'pipeline_capacity': pipeline_capacity,
+                'vectorized': vectorized,
+                'engine': engine,
+                'spin': spin,
+                'catch_up': catch_up,
+                'waveform_dir': waveform_dir,
+                'waveform_retention': waveform_retention,
+                'pre_event': pre_event,
+                'post_event': post_event,
+                'trigger': trigger,
+                'sta': sta,
+                'lta': lta,
+                'trigger_on': trigger_on,
+                'trigger_off': trigger_off,
+            }
+        elif isinstance(adc, str):
+            self._adc = open_adc(adc, block_frames or 1, target_fps)
+        else:
+            self._adc = adc
+
+        self._ring = None
+        self._process = None
+        self._connection = None
+        self._connection_lock = threading.Lock()
+        self._stats_request = 0
+
+        self._pipeline = None
+        self._recorder = None
+        self._trigger = None
+        self._event_callback = None
+        self._event_frames = 1
+        self._onset = (0, 0.0)
+        self._scheduler = FrameScheduler(
+            1.0 / target_fps, spin=spin, catch_up=catch_up)
         self._task_thread = None
         self._task_finished = None
         self.ready = False
+        self.triggered = False
         self.frame = 0
         self.xyz_accel = [0, 0, 0]
         self.seismic_scale = 0
+        self._display_changed = threading.Condition()
+        self._display_state = self._current_display_state()
+        self._reset_stats()
+
+    @property
+    def display_state(self):
+        return self._display_state
 
-    def start_calculation(self, callback=None, callback_interval=0.1):
+    @property
+    def scheduler_stats(self):
+        return self._scheduler.stats()
+
+    @property
+    def pipeline_stats(self):
+        if self._pipeline is None:
+            return None
+
+        return self._pipeline.stats()
+
+    @property
+    def ring(self):
+        return self._ring
+
+    def stats(self):
+        if self.isolated:
+            return self._isolated_stats()
+
+        elapsed = time.perf_counter() - self._started_at
+        frames = max(1, self._processed_frames)
+        pipeline_stats = self.pipeline_stats
+        missed_frames = self._scheduler.stats()['skipped_frames']
+        adc_read_time = self._adc_read_time
+        block_wait_time = None
+
+        if pipeline_stats is not None:
+            missed_frames += (
+                pipeline_stats['blocks_dropped'] * self.block_frames)
+            adc_read_time += pipeline_stats['read_time']
+            block_wait_time = pipeline_stats['block_wait_time'] / frames
+
+        return {
+            'frames': self._processed_frames,
+            'missed_frames': missed_frames,
+            'effective_rate': self._processed_frames / elapsed,
+            'callbacks': self._callbacks,
+            'events': self._events,
+            'adc_read_time': adc_read_time / frames,
+            'block_wait_time': block_wait_time,
+            'filter_time': self._calculator.filter_time / frames,
+            'percentile_time': self._calculator.percentile_time / frames,
+            'callback_time': (
+                self._callback_time / max(1, self._callbacks)),
+            'scheduler': None if self.block_frames else self.scheduler_stats,
+            'pipeline': pipeline_stats,
+            'recorder': self._recorder.stats() if self._recorder else None,
+        }
+
+    def start_calculation(
+            self,
+            callback=None,
+            callback_interval=0.1,
+            event_callback=None,
+            event_interval=None
+    ):
+        """Start calculating on a background thread.
+
+        ``callback`` runs every ``callback_interval`` seconds, or every
+        ``event_interval`` seconds while an event is triggered.
+        ``event_callback`` runs with a description of each event when it
+        starts and stops.
+        """
+        self._calculator = self._create_calculator()
+        self.xyz_accel = self._calculator.xyz_accel
+        self._reset_stats()
+        self._recorder = self._create_recorder()
+        self._configure_events(
+            callback_interval, event_callback, event_interval)
         self._task_finished = threading.Event()
+
+        if self.isolated:
+            self._start_acquisition_process()
+            target = self._consume_ring
+        elif self.block_frames:
+            self._pipeline = BlockPipeline(
+                self._adc,
+                block_frames=self.block_frames,
+                frame_interval=1.0 / self.target_fps,
+                capacity=self.pipeline_capacity
+            )
+            self._pipeline.start()
+            target = self._process_blocks
+        else:
+            target = self._calculate_seismic_scale
+
         self._task_thread = threading.Thread(
-            target=self._calculate_seismic_scale,
+            target=target,
             args=(callback, callback_interval)
         )
         self._task_thread.start()
 
+    def replay(
+            self,
+            callback=None,
+            callback_interval=0.1,
+            event_callback=None,
+            event_interval=None
+    ):
+        """Run the calculation on the calling thread as fast as the ADC
+        source delivers frames, until it raises ``EOFError``."""
+        if self.isolated:
+            raise ValueError('Replay cannot run in an acquisition process')
+
+        if callback is None:
+            def callback(self):
+                pass
+
+        self._calculator = self._create_calculator()
+        self.xyz_accel = self._calculator.xyz_accel
+        self._reset_stats()
+        self._recorder = self._create_recorder()
+        self._configure_events(
+            callback_interval, event_callback, event_interval)
+        callback_frames = max(1, int(self.target_fps * callback_interval))
+
+        try:
+            while True:
+                start_time = time.perf_counter()
+
+                if self.block_frames:
+                    samples = self._adc.read_frames(self.block_frames)
+                    self._adc_read_time += time.perf_counter() - start_time
+                    self._process_samples(samples, callback, callback_frames)
+                else:
+                    adc_values = self._adc.read()
+                    self._adc_read_time += time.perf_counter() - start_time
+                    self._process_frame(
+                        adc_values, callback, callback_frames)
+        except EOFError:
+            pass
+        finally:
+            self._close_recorder()
+
     def stop_calculation(self):
         self._task_finished.set()
         self._task_thread.join()
         self._task_thread = None
         self._task_finished = None
 
+        if self._pipeline is not None:
+            self._pipeline.stop()
+
+        if self._process is not None:
+            self._stop_acquisition_process()
+
+        self._close_recorder()
+        self.triggered = False
         self.frame = 0
         self.xyz_accel = [0, 0, 0]
         self.seismic_scale = 0
+        self._update_display_state()
+
+    def wait_for_display_change(self, display_state, timeout=None):
+        """Block until the display state differs from ``display_state``.
+
+        The display state is a ``(scale, ready, alert)`` tuple of the user
+        friendly scale, the ready flag and whether the scale reached
+        ``ALERT_SCALE``. The current state is returned, which is unchanged
+        if the timeout expired.
+        """
+        with self._display_changed:
+            self._display_changed.wait_for(
+                lambda: self._display_state != display_state, timeout)
+
+            return self._display_state
 
     def get_user_friendly_formatted_seismic_scale(self):
         if self.seismic_scale < 4.5:
@@ -123,74 +712,487 @@ class Seismometer(metaclass=Singleton):
 
         return output_scale
 
+    def _create_calculator(self):
+        if self.engine == 'jma':
+            calculator_class = JMAScaleCalculator
+        elif self.vectorized:
+            calculator_class = BlockScaleCalculator
+        else:
+            calculator_class = ScaleCalculator
+
+        return calculator_class(
+            target_fps=self.target_fps,
+            accel_frame=self.accel_frame,
+            accel_window=self.accel_window
+        )
+
+    def _create_recorder(self):
+        if self.waveform_dir is None or self.isolated:
+            return None
+
+        return WaveformRecorder(
+            self.waveform_dir,
+            self.target_fps,
+            channels=len(self._adc.channels),
+            retention=self.waveform_retention,
+            pre_event=self.pre_event,
+            post_event=self.post_event
+        )
+
+    def _configure_events(
+            self,
+            callback_interval,
+            event_callback,
+            event_interval
+    ):
+        if event_interval is None:
+            event_interval = callback_interval
+
+        self.triggered = False
+        self._event_callback = event_callback
+        self._event_frames = max(1, int(self.target_fps * event_interval))
+
+        # The acquisition process runs the trigger in isolated mode
+        if self.trigger == 'sta-lta' and not self.isolated:
+            self._trigger = StaLtaTrigger(
+                int(self.sta * self.target_fps),
+                int(self.lta * self.target_fps),
+                on_threshold=self.trigger_on,
+                off_threshold=self.trigger_off
+            )
+        else:
+            self._trigger = None
+
+    def _update_trigger(self):
+        # Scales are meaningless until the calculator is ready
+        if not self.ready:
+            return
+
+        if self._trigger is None:
+            triggered = self.seismic_scale >= ALERT_SCALE
+            ratio = None
+        else:
+            x, y, z = self.xyz_accel
+            self._trigger.update(x * x + y * y + z * z)
+            triggered = self._trigger.triggered
+            ratio = self._trigger.ratio
+
+        if triggered != self.triggered:
+            self._set_triggered(triggered, ratio)
+
+    def _set_triggered(self, triggered, ratio=None):
+        now = time.time()
+        self.triggered = triggered
+
+        if triggered:
+            self._events += 1
+            self._onset = (self.frame, now)
+
+        event = {
+            'event': 'start' if triggered else 'stop',
+            'frame': self.frame,
+            'timestamp': now,
+            'onset': self._onset[1],
+            'duration': (self.frame - self._onset[0]) / self.target_fps,
+            'seismic_scale': self.seismic_scale,
+        }
+
+        if ratio is not None:
+            event['ratio'] = ratio
+
+        logging.info(
+            'Seismic event %s at frame %d', event['event'], self.frame)
+
+        if self._event_callback is not None:
+            self._event_callback(self, event)
+
+    def _callback_due(self, callback_frames):
+        return (
+            self.frame % callback_frames == 0
+            or (self.triggered and self.frame % self._event_frames == 0)
+        )
+
+    def _close_recorder(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
     def _calculate_seismic_scale(self, callback, callback_interval):
-        xyz_adc = [
-            collections.deque(maxlen=TARGET_FPS),
-            collections.deque(maxlen=TARGET_FPS),
-            collections.deque(maxlen=TARGET_FPS)
-        ]
-        xyz_gals = [0, 0, 0]
-        accel_values = collections.deque(maxlen=TARGET_FPS * 5)
-        target_time = time.time()
+        callback_frames = max(1, int(self.target_fps * callback_interval))
+        self._scheduler.reset()
 
         while not self._task_finished.is_set():
-            self.frame += 1
+            start_time = time.perf_counter()
+            adc_values = self._adc.read()
+            self._adc_read_time += time.perf_counter() - start_time
+
+            self._process_frame(adc_values, callback, callback_frames)
+            self._scheduler.wait()
 
-            for i in range(3):
-                adc_val = self._adc[i].raw_value
-                xyz_adc[i].append(adc_val)
+    def _process_blocks(self, callback, callback_interval):
+        callback_frames = max(1, int(self.target_fps * callback_interval))
+        blocks_dropped = 0
 
-                offset = sum(xyz_adc[i]) / len(xyz_adc[i])
-                xyz_gals[i] = xyz_gals[i] * 0.94 + adc_val * 0.06
-                self.xyz_accel[i] = (xyz_gals[i] - offset) * ADC_TO_GAL
+        while not self._task_finished.is_set():
+            block = self._pipeline.get(timeout=0.5)
 
-            accel_values.append(
-                self._calculate_composite_acceleration(self.xyz_accel))
+            if block is None:
+                continue
 
             try:
-                continous_accel = sorted(accel_values)[-ACCEL_FRAME]
+                self._process_samples(block, callback, callback_frames)
+            finally:
+                self._pipeline.release(block)
 
-                if continous_accel > 0:
-                    self.seismic_scale = 2 * math.log10(continous_accel) + 0.94
-                else:
-                    self.seismic_scale = 0
-            except IndexError:
-                pass
+            stats = self._pipeline.stats()
 
-            if self.frame % int(TARGET_FPS * callback_interval) == 0:
-                callback(self)
+            if stats['blocks_dropped'] != blocks_dropped:
+                logging.warning(
+                    'Dropped %d sample blocks',
+                    stats['blocks_dropped'] - blocks_dropped
+                )
+                blocks_dropped = stats['blocks_dropped']
 
-            if self.frame >= MAX_32_BIT_INT:
-                self.frame = MAX_32_BIT_INT % TARGET_FPS
+    def _start_acquisition_process(self):
+        context = multiprocessing.get_context('spawn')
+        self._ring = SharedRing(
+            int(self.target_fps * RING_SECONDS), create=True)
+        self._ring_lost = 0
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_run_acquisition_process,
+            args=(
+                child_connection,
+                self._ring.name,
+                self._ring.capacity,
+                self._isolated_kwargs
+            ),
+            daemon=True
+        )
+        self._process.start()
 
-            if not self.ready:
-                if self.seismic_scale < 0:
-                    self.ready = True
+    def _stop_acquisition_process(self):
+        try:
+            with self._connection_lock:
+                self._connection.send(('stop', None))
+        except (BrokenPipeError, OSError):
+            pass
 
-            target_time += LOOP_DELTA
-            sleep_time = target_time - time.time()
+        self._process.join()
+        self._connection.close()
+        self._ring.close()
+        self._ring.unlink()
+        self._process = None
+        self._connection = None
+        self._ring = None
 
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+    def _isolated_stats(self):
+        process_stats = None
 
-    @classmethod
-    def _calculate_composite_acceleration(cls, xyz_accel):
-        return math.sqrt(
-            (xyz_accel[0] ** 2)
-            + (xyz_accel[1] ** 2)
-            + (xyz_accel[2] ** 2)
+        with self._connection_lock:
+            if self._connection is not None:
+                self._stats_request += 1
+                self._connection.send(('stats', self._stats_request))
+                deadline = time.monotonic() + 1
+
+                # Discard late answers to requests that already timed out
+                while self._connection.poll(
+                        max(0, deadline - time.monotonic())):
+                    request, stats = self._connection.recv()
+
+                    if request == self._stats_request:
+                        process_stats = stats
+                        break
+
+        return {
+            'frames': self._processed_frames,
+            'callbacks': self._callbacks,
+            'events': self._events,
+            'callback_time': (
+                self._callback_time / max(1, self._callbacks)),
+            'ring_written': self._ring.written if self._ring else 0,
+            'ring_lost': self._ring_lost,
+            'process': process_stats,
+        }
+
+    def _consume_ring(self, callback, callback_interval):
+        callback_frames = max(1, int(self.target_fps * callback_interval))
+        position = 0
+
+        while not self._task_finished.wait(RING_POLL_INTERVAL):
+            position, records, lost = self._ring.read(position)
+            self._ring_lost += lost
+
+            for record in records:
+                frame, triggered = record[0], record[6]
+
+                if (
+                        triggered != self.triggered
+                        or frame % callback_frames == 0
+                        or (triggered and frame % self._event_frames == 0)
+                ):
+                    self._load_record(record)
+
+                    if triggered != self.triggered:
+                        self._set_triggered(triggered)
+
+                    if self._callback_due(callback_frames):
+                        self._run_callback(callback)
+
+            if records:
+                self._load_record(records[-1])
+                self._processed_frames += len(records)
+                self._update_display_state()
+
+            if not self._process.is_alive():
+                logging.error('Acquisition process exited unexpectedly')
+                break
+
+    def _load_record(self, record):
+        self.frame, self.seismic_scale, x, y, z, self.ready, _ = record
+        self.xyz_accel = [x, y, z]
+
+    def _process_samples(self, block, callback, callback_frames):
+        if isinstance(self._calculator, BlockScaleCalculator):
+            self._process_block(block, callback, callback_frames)
+        else:
+            channels = len(self._adc.channels)
+
+            for i in range(0, len(block), channels):
+                self._process_frame(
+                    block[i:i + channels], callback, callback_frames)
+
+    def _process_block(self, block, callback, callback_frames):
+        scales, xyz_accel = self._calculator.update_block(block)
+        first_frame = self.frame + 1
+        ready_index = None
+
+        if not self.ready:
+            negative_scales = numpy.flatnonzero(scales < 0)
+
+            if negative_scales.size:
+                ready_index = negative_scales[0]
+
+        if self.ready:
+            ready_from = 0
+        elif ready_index is not None:
+            ready_from = ready_index + 1
+        else:
+            ready_from = len(scales)
+
+        triggered, ratios = self._block_trigger_states(
+            scales, xyz_accel, ready_from)
+        previous = numpy.concatenate(([self.triggered], triggered[:-1]))
+        changes = numpy.flatnonzero(triggered != previous)
+
+        if self._recorder is not None:
+            self._recorder.extend(block)
+            triggered_indices = numpy.flatnonzero(triggered)
+
+            if triggered_indices.size:
+                first_position = self._recorder.written - len(scales)
+                self._recorder.trigger(
+                    first_position + triggered_indices[0])
+                self._recorder.trigger(
+                    first_position + triggered_indices[-1])
+
+        frames = first_frame + numpy.arange(len(scales))
+        event_indices = numpy.flatnonzero(
+            triggered & (frames % self._event_frames == 0))
+        callback_indices = range(
+            -first_frame % callback_frames, len(scales), callback_frames)
+
+        for i in sorted(set(callback_indices).union(
+                event_indices.tolist(), changes.tolist())):
+            self.frame = first_frame + i
+            self.seismic_scale = float(scales[i])
+            self.xyz_accel = xyz_accel[i].tolist()
+
+            if ready_index is not None and i > ready_index:
+                self.ready = True
+
+            if triggered[i] != self.triggered:
+                self._set_triggered(bool(triggered[i]), ratios[i])
+
+            if self._callback_due(callback_frames):
+                self._run_callback(callback)
+
+        self._processed_frames += len(scales)
+        self.frame = first_frame + len(scales) - 1
+        self.seismic_scale = self._calculator.seismic_scale
+        self.xyz_accel = self._calculator.xyz_accel
+
+        if self.frame >= MAX_32_BIT_INT:
+            self.frame = MAX_32_BIT_INT % self.target_fps
+
+        if ready_index is not None:
+            self.ready = True
+
+        self._update_display_state()
+
+    def _block_trigger_states(self, scales, xyz_accel, ready_from):
+        triggered = numpy.zeros(len(scales), dtype=bool)
+        ratios = [None] * len(scales)
+
+        if self._trigger is None:
+            triggered[ready_from:] = scales[ready_from:] >= ALERT_SCALE
+        else:
+            energies = (xyz_accel[ready_from:] ** 2).sum(axis=1)
+
+            for i, energy in enumerate(energies.tolist(), ready_from):
+                self._trigger.update(energy)
+                triggered[i] = self._trigger.triggered
+                ratios[i] = self._trigger.ratio
+
+        return triggered, ratios
+
+    def _process_frame(self, adc_values, callback, callback_frames):
+        self.frame += 1
+        self._processed_frames += 1
+        self.seismic_scale = self._calculator.update(adc_values)
+        self.xyz_accel = self._calculator.xyz_accel
+        self._update_trigger()
+
+        if self._recorder is not None:
+            self._recorder.append(adc_values)
+
+            if self.triggered:
+                self._recorder.trigger()
+
+        if self._callback_due(callback_frames):
+            self._run_callback(callback)
+
+        if self.frame >= MAX_32_BIT_INT:
+            self.frame = MAX_32_BIT_INT % self.target_fps
+
+        if not self.ready:
+            if self.seismic_scale < 0:
+                self.ready = True
+
+        self._update_display_state()
+
+    def _current_display_state(self):
+        return (
+            self.get_user_friendly_formatted_seismic_scale(),
+            self.ready,
+            self.seismic_scale >= ALERT_SCALE
         )
 
+    def _update_display_state(self):
+        display_state = self._current_display_state()
+
+        if display_state != self._display_state:
+            with self._display_changed:
+                self._display_state = display_state
+                self._display_changed.notify_all()
+
+    def _run_callback(self, callback):
+        start_time = time.perf_counter()
+        callback(self)
+        self._callback_time += time.perf_counter() - start_time
+        self._callbacks += 1
+
+    def _reset_stats(self):
+        self._ring_lost = 0
+        self._events = 0
+        self._started_at = time.perf_counter()
+        self._processed_frames = 0
+        self._callbacks = 0
+        self._adc_read_time = 0.0
+        self._callback_time = 0.0
+
+
+def _run_acquisition_process(
+        connection,
+        ring_name,
+        ring_capacity,
+        seismometer_kwargs
+):
+    ring = SharedRing(ring_capacity, name=ring_name)
+    seismometer = Seismometer(**seismometer_kwargs)
+
+    def _callback(self):
+        ring.write(
+            self.frame,
+            self.seismic_scale,
+            self.xyz_accel,
+            self.ready,
+            self.triggered
+        )
+
+    seismometer.start_calculation(_callback, 1.0 / seismometer.target_fps)
+
+    try:
+        while True:
+            command, request = connection.recv()
+
+            if command == 'stats':
+                connection.send((request, seismometer.stats()))
+            else:
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        seismometer.stop_calculation()
+        ring.close()
+
 
 @click.group()
 def cmd():
     pass
 
 
+def seismometer_options(function):
+    options = [
+        click.option('--fps', '-f', 'target_fps', default=TARGET_FPS),
+        click.option('--accel-frame', '-a', type=int),
+        click.option(
+            '--window', '-w', 'accel_window', default=float(ACCEL_WINDOW)),
+        click.option(
+            '--adc',
+            type=click.Choice(sorted(ADC_BACKENDS)),
+            default=ADC_BACKEND
+        ),
+        click.option('--block-frames', '-b', type=int),
+        click.option(
+            '--pipeline-capacity', default=PIPELINE_CAPACITY),
+        click.option('--vectorized', is_flag=True),
+        click.option(
+            '--engine', type=click.Choice(ENGINES), default='simple'),
+        click.option('--spin', default=0.0),
+        click.option(
+            '--catch-up',
+            type=click.Choice(CATCH_UP_POLICIES),
+            default='compress'
+        ),
+        click.option('--isolated', is_flag=True),
+        click.option('--waveform-dir', type=click.Path(file_okay=False)),
+        click.option(
+            '--retention',
+            'waveform_retention',
+            default=float(WAVEFORM_RETENTION)
+        ),
+        click.option('--pre-event', default=float(PRE_EVENT)),
+        click.option('--post-event', default=float(POST_EVENT)),
+        click.option(
+            '--trigger', type=click.Choice(TRIGGERS), default='alert'),
+        click.option('--sta', default=float(STA_WINDOW)),
+        click.option('--lta', default=float(LTA_WINDOW)),
+        click.option('--trigger-on', default=TRIGGER_ON_RATIO),
+        click.option('--trigger-off', default=TRIGGER_OFF_RATIO),
+    ]
+
+    for option in reversed(options):
+        function = option(function)
+
+    return function
+
+
 @cmd.command()
 @click.option('--interval', '-i', default=0.1)
+@seismometer_options
 @click.option('--verbose', '-v', is_flag=True)
-def detect_earthquakes(interval, verbose):
+def detect_earthquakes(interval, verbose, **seismometer_kwargs):
     if interval < 0.1:
         raise ValueError('Interval value should be at least 0.1 seconds')
 
@@ -205,14 +1207,46 @@ def detect_earthquakes(interval, verbose):
             self.frame
         )
 
-    active_seismometer(_callback, interval)
+    active_seismometer(_callback, interval, **seismometer_kwargs)
+
 
 @cmd.command()
 @click.argument('broker')
 @click.argument('topic')
 @click.option('--interval', '-i', default=0.1)
+@click.option('--stats-topic')
+@click.option('--stats-interval', default=60.0)
+@click.option('--batch-size', default=1)
+@click.option('--max-rate', default=10.0)
+@click.option('--backlog', default=1000)
+@click.option(
+    '--payload-format',
+    type=click.Choice(sorted(PAYLOAD_ENCODERS)),
+    default='json'
+)
+@click.option('--deadband', type=float)
+@click.option('--heartbeat', default=60.0)
+@click.option('--event-topic')
+@click.option('--event-interval', type=float)
+@seismometer_options
 @click.option('--verbose', '-v', is_flag=True)
-def detect_publish_earthquakes(broker, topic, interval, verbose):
+def detect_publish_earthquakes(
+        broker,
+        topic,
+        interval,
+        stats_topic,
+        stats_interval,
+        batch_size,
+        max_rate,
+        backlog,
+        payload_format,
+        deadband,
+        heartbeat,
+        event_topic,
+        event_interval,
+        verbose,
+        **seismometer_kwargs
+):
     if interval < 0.1:
         raise ValueError('Interval value should be at least 0.1 seconds')
 
@@ -248,40 +1282,143 @@ def detect_publish_earthquakes(broker, topic, interval, verbose):
 
     atexit.register(_exit_handler)
 
+    publisher = BatchPublisher(
+        client,
+        topic,
+        max_rate=max_rate,
+        max_batch=batch_size,
+        backlog=backlog,
+        encode=PAYLOAD_ENCODERS[payload_format]
+    )
+    publisher.start()
+    atexit.register(publisher.stop)
+
+    if deadband is not None:
+        report_by_exception = ReportByException(deadband, heartbeat)
+    else:
+        report_by_exception = None
+
+    next_stats_time = time.monotonic() + stats_interval
+
     def _callback(self):
+        nonlocal next_stats_time
+
+        if stats_topic and time.monotonic() >= next_stats_time:
+            stats = self.stats()
+            stats['publisher'] = publisher.stats()
+
+            if report_by_exception:
+                stats['report_by_exception'] = report_by_exception.stats()
+
+            client.publish(stats_topic, json.dumps(stats))
+            next_stats_time += stats_interval
+
         if self.ready:
-            message = json.dumps({
+            reading = {
                 'seismic_scale':  self.seismic_scale,
                 'x_acceleration': self.xyz_accel[0],
                 'y_acceleration': self.xyz_accel[1],
                 'z_acceleration': self.xyz_accel[2],
-            })
+                'timestamp': time.time(),
+            }
+
+            # Every reading is worth publishing during an event
+            if report_by_exception and not self.triggered:
+                reading = report_by_exception.update(
+                    reading, self.get_user_friendly_formatted_seismic_scale())
+
+            if reading:
+                publisher.put(reading)
 
-            client.publish(topic, message)
-            logging.debug('Published message: %s', message)
+    def _event_callback(self, event):
+        if event_topic:
+            client.publish(event_topic, json.dumps(event))
 
-    active_seismometer(_callback, interval)
+    active_seismometer(
+        _callback,
+        interval,
+        event_callback=_event_callback,
+        event_interval=event_interval,
+        **seismometer_kwargs
+    )
 
 
-def active_seismometer(callback, callback_interval):
+@cmd.command()
+@click.argument('capture', type=click.Path(exists=True, dir_okay=False))
+@click.option('--interval', '-i', default=0.1)
+@seismometer_options
+def replay(capture, interval, **seismometer_kwargs):
+    if seismometer_kwargs['isolated']:
+        raise ValueError('--isolated is not supported when replaying')
+
+    seismometer_kwargs['adc'] = ReplayADC.from_file(
+        capture, max_frames=seismometer_kwargs['block_frames'] or 1)
+
+    def _callback(self):
+        click.echo('{},{:.4f},{:.4f},{:.4f},{:.4f}'.format(
+            self.frame, self.seismic_scale, *self.xyz_accel))
+
+    click.echo(
+        'frame,seismic_scale,x_acceleration,y_acceleration,z_acceleration')
+    Seismometer(**seismometer_kwargs).replay(_callback, interval)
+
+
+@cmd.command()
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--seconds', '-s', default=60)
+@click.option('--fps', '-f', 'target_fps', default=TARGET_FPS)
+@click.option(
+    '--adc',
+    type=click.Choice(sorted(ADC_BACKENDS)),
+    default=ADC_BACKEND
+)
+def record(output, seconds, target_fps, adc):
+    chunk_frames = max(1, target_fps // 10)
+    source = open_adc(adc, chunk_frames, target_fps)
+    frames = []
+
+    try:
+        for _ in range(math.ceil(seconds * target_fps / chunk_frames)):
+            values = source.read_frames(chunk_frames, 1.0 / target_fps)
+            frames.extend(
+                tuple(values[i:i + len(source.channels)])
+                for i in range(0, len(values), len(source.channels))
+            )
+    finally:
+        source.close()
+
+    save_capture(output, frames)
+
+
+def active_seismometer(
+        callback,
+        callback_interval,
+        event_callback=None,
+        event_interval=None,
+        **seismometer_kwargs
+):
     buzzer = Buzzer(3)
     status_led = LED(26)
     scale_led = LEDBoard(a=18, b=23, c=12, d=19, e=6, f=22, g=17, xdp=16)
 
-    seismometer = Seismometer()
-    seismometer.start_calculation(callback, callback_interval)
+    seismometer = Seismometer(**seismometer_kwargs)
+    seismometer.start_calculation(
+        callback, callback_interval, event_callback, event_interval)
+
+    display_state = None
 
     while True:
         try:
-            seismic_scale = seismometer.seismic_scale
-            scale_led.value = SCALE_LED_CHARSETS[
-                seismometer.get_user_friendly_formatted_seismic_scale()]
+            display_state = seismometer.wait_for_display_change(
+                display_state, timeout=1)
+            output_scale, ready, alert = display_state
+            scale_led.value = SCALE_LED_CHARSETS[output_scale]
 
-            if seismometer.ready:
+            if ready:
                 if not status_led.is_lit:
                     status_led.on()
 
-                if seismic_scale >= 3.5:
+                if alert:
                     if not buzzer.is_active:
                         buzzer.on()
                 else:
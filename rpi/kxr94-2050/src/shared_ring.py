@@ -0,0 +1,87 @@
+import struct
+from multiprocessing import shared_memory
+
+HEADER = struct.Struct('<Q')
+RECORD = struct.Struct('<Qd3d??6x')
+
+
+class SharedRing:
+    """Single-writer ring of seismometer frames in shared memory.
+
+    The header holds the number of records ever written. Each record
+    holds the frame number, seismic scale, x, y and z acceleration, the
+    ready flag and the event trigger flag, packed as ``RECORD``. Readers
+    can map the record area directly through ``records_view`` or copy out
+    new records with ``read``; records overwritten while being read are
+    reported as lost.
+    """
+
+    def __init__(self, capacity, name=None, create=False):
+        self.capacity = capacity
+        self._shared_memory = shared_memory.SharedMemory(
+            name=name,
+            create=create,
+            size=HEADER.size + capacity * RECORD.size
+        )
+        self._buffer = self._shared_memory.buf
+        self._records = self._buffer[HEADER.size:]
+        self._written = 0
+
+        if create:
+            HEADER.pack_into(self._buffer, 0, 0)
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    @property
+    def written(self):
+        # Read twice so a torn 64-bit read on 32-bit boards is retried
+        while True:
+            written = HEADER.unpack_from(self._buffer, 0)[0]
+
+            if written == HEADER.unpack_from(self._buffer, 0)[0]:
+                return written
+
+    def records_view(self):
+        return self._records
+
+    def write(self, frame, seismic_scale, xyz_accel, ready, triggered):
+        RECORD.pack_into(
+            self._records,
+            (self._written % self.capacity) * RECORD.size,
+            frame,
+            seismic_scale,
+            xyz_accel[0],
+            xyz_accel[1],
+            xyz_accel[2],
+            ready,
+            triggered
+        )
+        self._written += 1
+        HEADER.pack_into(self._buffer, 0, self._written)
+
+    def read(self, position):
+        """Return the new position, records since position and lost count."""
+        written = self.written
+        lost = max(0, written - self.capacity - position)
+        position += lost
+        records = [
+            RECORD.unpack_from(
+                self._records, (index % self.capacity) * RECORD.size)
+            for index in range(position, written)
+        ]
+
+        # Drop records the writer may have overwritten while we read them,
+        # including the slot it is packing the next record into
+        overwritten = max(0, self.written + 1 - self.capacity - position)
+
+        return written, records[overwritten:], lost + overwritten
+
+    def close(self):
+        self._records.release()
+        self._buffer = None
+        self._shared_memory.close()
+
+    def unlink(self):
+        self._shared_memory.unlink()
@@ -0,0 +1,40 @@
+from shared_ring import RECORD
+from shared_ring import SharedRing
+
+
+def test_read_at_capacity_skips_slot_being_written():
+    ring = SharedRing(4, create=True)
+
+    try:
+        for frame in range(4):
+            ring.write(frame, 1.0, (0.0, 0.0, 0.0), True, False)
+
+        # The writer is packing frame 4 into the slot of frame 0
+        RECORD.pack_into(
+            ring.records_view(), 0, 4, 9.0, 9.0, 9.0, 9.0, True, True)
+
+        position, records, lost = ring.read(0)
+
+        assert position == 4
+        assert [record[0] for record in records] == [1, 2, 3]
+        assert lost == 1
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_read_below_capacity_returns_every_record():
+    ring = SharedRing(4, create=True)
+
+    try:
+        for frame in range(3):
+            ring.write(frame, 1.0, (0.0, 0.0, 0.0), True, False)
+
+        position, records, lost = ring.read(0)
+
+        assert position == 3
+        assert [record[0] for record in records] == [0, 1, 2]
+        assert lost == 0
+    finally:
+        ring.close()
+        ring.unlink()
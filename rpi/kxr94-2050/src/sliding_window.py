@@ -0,0 +1,202 @@
+import array
+import collections
+import heapq
+
+
+class OrderStatisticWindow:
+    """Sliding window answering the rank-th largest value of its contents.
+
+    Values are kept in two heaps: ``_upper`` is a min-heap of the ``rank``
+    largest values and ``_lower`` a max-heap, of negated values, of the
+    rest, so the answer is always ``_upper[0]``. Evicted values are only
+    counted as deleted and popped once they reach the top of their heap.
+    Both heaps are rebuilt from the window once deleted values outnumber
+    live ones, so insertion and eviction take amortized O(log n).
+    """
+
+    def __init__(self, size, rank):
+        if not 0 < rank <= size:
+            raise ValueError('Rank should be between 1 and window size')
+
+        self.size = size
+        self.rank = rank
+        self._values = collections.deque()
+        self._lower = []
+        self._upper = []
+        self._lower_deleted = collections.Counter()
+        self._upper_deleted = collections.Counter()
+        self._lower_size = 0
+        self._upper_size = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value):
+        if len(self._values) == self.size:
+            self._remove(self._values.popleft())
+
+        self._values.append(value)
+
+        if self._lower_size and value <= -self._lower[0]:
+            heapq.heappush(self._lower, -value)
+            self._lower_size += 1
+        else:
+            heapq.heappush(self._upper, value)
+            self._upper_size += 1
+
+        self._rebalance()
+
+        if len(self._lower) + len(self._upper) > 2 * len(self._values):
+            self._rebuild()
+
+    def clear(self):
+        self._values.clear()
+        self._rebuild()
+
+    def kth_largest(self):
+        if self._upper_size < self.rank:
+            raise IndexError('Window holds fewer values than rank')
+
+        return self._upper[0]
+
+    def _remove(self, value):
+        # Values equal to the top of _upper may sit in either heap, but
+        # _upper is sure to hold a live one
+        if self._upper_size and value >= self._upper[0]:
+            self._upper_deleted[value] += 1
+            self._upper_size -= 1
+        else:
+            self._lower_deleted[-value] += 1
+            self._lower_size -= 1
+
+        self._prune()
+
+    def _rebalance(self):
+        while self._upper_size > self.rank:
+            heapq.heappush(self._lower, -heapq.heappop(self._upper))
+            self._upper_size -= 1
+            self._lower_size += 1
+            self._prune()
+
+        while self._upper_size < self.rank and self._lower_size:
+            heapq.heappush(self._upper, -heapq.heappop(self._lower))
+            self._lower_size -= 1
+            self._upper_size += 1
+            self._prune()
+
+    def _prune(self):
+        for heap, deleted in (
+                (self._lower, self._lower_deleted),
+                (self._upper, self._upper_deleted),
+        ):
+            while heap and deleted[heap[0]]:
+                deleted[heap[0]] -= 1
+                heapq.heappop(heap)
+
+    def _rebuild(self):
+        values = sorted(self._values)
+        split = len(values) - min(self.rank, len(values))
+
+        # Sorted lists are valid heaps
+        self._lower = [-value for value in reversed(values[:split])]
+        self._upper = values[split:]
+        self._lower_deleted.clear()
+        self._upper_deleted.clear()
+        self._lower_size = len(self._lower)
+        self._upper_size = len(self._upper)
+
+
+class RingBuffer:
+    """Fixed-size ring buffer backed by a compact ``array.array``."""
+
+    def __init__(self, size, typecode='d'):
+        self.size = size
+        self._buffer = array.array(typecode, [0] * size)
+        self._index = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        start = (self._index - self._length) % self.size
+
+        for i in range(self._length):
+            yield self._buffer[(start + i) % self.size]
+
+    def append(self, value):
+        """Store value and return the one it overwrote, if any."""
+        evicted = None
+
+        if self._length == self.size:
+            evicted = self._buffer[self._index]
+        else:
+            self._length += 1
+
+        self._buffer[self._index] = value
+        self._index = (self._index + 1) % self.size
+
+        return evicted
+
+    def clear(self):
+        self._index = 0
+        self._length = 0
+
+
+class MovingAverage:
+    """Moving average kept as a running sum over a sliding window.
+
+    The running sum is recomputed from the window contents every
+    ``resync_interval`` appends so that floating point error cannot
+    accumulate. ``compact`` stores the window in a ``RingBuffer``
+    instead of a deque.
+    """
+
+    def __init__(
+            self,
+            size,
+            compact=False,
+            typecode='d',
+            resync_interval=None
+    ):
+        self.size = size
+        self.resync_interval = resync_interval or size
+
+        if compact:
+            self._values = RingBuffer(size, typecode)
+        else:
+            self._values = collections.deque(maxlen=size)
+
+        self._sum = 0
+        self._appends = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def mean(self):
+        return self._sum / len(self._values)
+
+    def append(self, value):
+        values = self._values
+
+        if isinstance(values, RingBuffer):
+            evicted = values.append(value)
+        else:
+            evicted = values[0] if len(values) == self.size else None
+            values.append(value)
+
+        if evicted is not None:
+            self._sum -= evicted
+
+        self._sum += value
+        self._appends += 1
+
+        if self._appends >= self.resync_interval:
+            self._sum = sum(values)
+            self._appends = 0
+
+    def clear(self):
+        self._values.clear()
+        self._sum = 0
+        self._appends = 0
@@ -0,0 +1,75 @@
+import itertools
+import json
+import struct
+
+# Binary payloads are made of sections, each starting with the format
+# version, which can never be the first byte of a JSON document, followed
+# by the record type and count of the records that follow
+TELEMETRY_VERSION = 1
+HEADER = struct.Struct('<BBH')
+
+RECORD_SEISMOMETER = 1
+SEISMOMETER_RECORD = struct.Struct('<d4f')
+SEISMOMETER_FIELDS = (
+    'timestamp',
+    'seismic_scale',
+    'x_acceleration',
+    'y_acceleration',
+    'z_acceleration',
+)
+
+# Heartbeat readings carry a summary of the readings since the last one
+RECORD_SEISMOMETER_SUMMARY = 4
+SEISMOMETER_SUMMARY_RECORD = struct.Struct('<d7f')
+SEISMOMETER_SUMMARY_FIELDS = SEISMOMETER_FIELDS + (
+    'min_seismic_scale',
+    'max_seismic_scale',
+    'mean_seismic_scale',
+)
+
+RECORD_FORMATS = {
+    RECORD_SEISMOMETER: (SEISMOMETER_RECORD, SEISMOMETER_FIELDS),
+    RECORD_SEISMOMETER_SUMMARY: (
+        SEISMOMETER_SUMMARY_RECORD, SEISMOMETER_SUMMARY_FIELDS),
+}
+
+
+def encode_json(readings):
+    # A lone reading is sent as a plain object, as unbatched publishers do
+    return json.dumps(readings[0] if len(readings) == 1 else readings)
+
+
+def record_type(reading):
+    if 'mean_seismic_scale' in reading:
+        return RECORD_SEISMOMETER_SUMMARY
+
+    return RECORD_SEISMOMETER
+
+
+def encode_binary(readings):
+    """Pack readings into one section per run of the same record type."""
+    sections = []
+
+    for section_type, section in itertools.groupby(readings, record_type):
+        section = list(section)
+        record, fields = RECORD_FORMATS[section_type]
+        payload = bytearray(HEADER.size + len(section) * record.size)
+        HEADER.pack_into(
+            payload, 0, TELEMETRY_VERSION, section_type, len(section))
+
+        for i, reading in enumerate(section):
+            record.pack_into(
+                payload,
+                HEADER.size + i * record.size,
+                *(reading[field] for field in fields)
+            )
+
+        sections.append(payload)
+
+    return b''.join(sections)
+
+
+PAYLOAD_ENCODERS = {
+    'json': encode_json,
+    'binary': encode_binary,
+}
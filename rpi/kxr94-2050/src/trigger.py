@@ -0,0 +1,68 @@
+from sliding_window import MovingAverage
+
+TRIGGERS = ('alert', 'sta-lta')
+MIN_LTA = 1e-9  # Keeps the ratio finite over a perfectly quiet baseline
+
+
+class StaLtaTrigger:
+    """Short-term over long-term average trigger, one sample at a time.
+
+    Samples are energies of the characteristic function, e.g. the
+    squared acceleration. Both averages are running sums, so every update
+    costs the same regardless of the window lengths. The trigger turns on
+    once the long-term window has filled and the ratio rises above
+    ``on_threshold``, and off when it falls below ``off_threshold``. The
+    long-term average is frozen while triggered so that an event does not
+    raise its own baseline.
+    """
+
+    def __init__(
+            self,
+            sta_frames,
+            lta_frames,
+            on_threshold=3.0,
+            off_threshold=1.5
+    ):
+        if sta_frames >= lta_frames:
+            raise ValueError('STA window should be shorter than LTA window')
+
+        if off_threshold > on_threshold:
+            raise ValueError(
+                'Off threshold should not exceed the on threshold')
+
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self._sta = MovingAverage(sta_frames)
+        self._lta = MovingAverage(lta_frames)
+        self.triggered = False
+        self.ratio = 0.0
+
+    def update(self, energy):
+        """Return ``start`` or ``stop`` when the trigger changes state."""
+        self._sta.append(energy)
+
+        if not self.triggered:
+            self._lta.append(energy)
+
+        if len(self._lta) < self._lta.size:
+            return None
+
+        self.ratio = self._sta.mean / max(self._lta.mean, MIN_LTA)
+
+        if not self.triggered and self.ratio > self.on_threshold:
+            self.triggered = True
+
+            return 'start'
+
+        if self.triggered and self.ratio < self.off_threshold:
+            self.triggered = False
+
+            return 'stop'
+
+        return None
+
+    def clear(self):
+        self._sta.clear()
+        self._lta.clear()
+        self.triggered = False
+        self.ratio = 0.0
@@ -0,0 +1,326 @@
+import asyncio
+import collections
+import logging
+import math
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from line_protocol import LineEncoder
+
+
+class PahoAdapter:
+    """Drive a paho client from the asyncio event loop.
+
+    paho's socket callbacks hand the broker socket to the loop, which
+    then calls ``loop_read`` and ``loop_write`` when it is ready, so no
+    network thread is needed.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self._misc = None
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+        if self._misc is not None:
+            self._misc.cancel()
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # Keepalive pings and retries of unacknowledged messages
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncBatchWriter:
+    """Write points to InfluxDB over pooled keep-alive connections.
+
+    Points are buffered like in ``BatchWriter`` and flushed as soon as
+    ``batch_size`` points are buffered or ``flush_interval`` seconds have
+    passed. Up to ``connections`` batches are posted concurrently as line
+    protocol over one ``aiohttp`` session.
+    """
+
+    def __init__(
+            self,
+            url,
+            params,
+            batch_size=500,
+            flush_interval=1.0,
+            buffer_size=100000,
+            max_retries=5,
+            retry_delay=0.5,
+            max_retry_delay=30.0,
+            connections=4
+    ):
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for the asyncio engine')
+
+        self.url = url
+        self.params = params
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connections = connections
+        self._encoder = LineEncoder()
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._batch_ready = None
+        self._posts = set()
+        self._semaphore = None
+        self._session = None
+        self._task = None
+        self._stopped = False
+
+        self._points_written = 0
+        self._points_dropped = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._retries = 0
+        self._last_flush_duration = 0.0
+        self._max_flush_duration = 0.0
+
+    async def start(self):
+        self._batch_ready = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.connections)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections))
+        self._task = asyncio.get_running_loop().create_task(self._write())
+
+    async def stop(self):
+        """Stop once every buffered point has been posted."""
+        self._stopped = True
+        self._batch_ready.set()
+        await self._task
+
+        if self._posts:
+            await asyncio.wait(self._posts)
+
+        await self._session.close()
+
+    def put(self, points):
+        for point in points:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._points_dropped += 1
+
+            self._buffer.append(point)
+
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    def stats(self):
+        return {
+            'points_written': self._points_written,
+            'points_dropped': self._points_dropped,
+            'flushes': self._flushes,
+            'failed_flushes': self._failed_flushes,
+            'retries': self._retries,
+            'last_flush_duration': self._last_flush_duration,
+            'max_flush_duration': self._max_flush_duration,
+            'buffered': len(self._buffer),
+            'in_flight': len(self._posts),
+        }
+
+    async def _write(self):
+        loop = asyncio.get_running_loop()
+
+        while not (self._stopped and not self._buffer):
+            if not self._stopped:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._batch_ready.clear()
+
+            while self._buffer:
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self.batch_size, len(self._buffer)))
+                ]
+
+                # Wait for a free connection rather than queueing posts
+                await self._semaphore.acquire()
+                post = loop.create_task(self._post(batch))
+                self._posts.add(post)
+                post.add_done_callback(self._posts.discard)
+
+                if len(self._buffer) < self.batch_size and not self._stopped:
+                    break
+
+    async def _post(self, batch):
+        start = time.monotonic()
+        delay = self.retry_delay
+        body = self._encoder.encode(batch)
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._session.post(
+                            self.url, params=self.params, data=body
+                    ) as response:
+                        if response.status == 204:
+                            break
+
+                        raise RuntimeError('HTTP {}: {}'.format(
+                            response.status, await response.text()))
+                except Exception:
+                    logging.warning(
+                        'Failed to write %d points (attempt %d)',
+                        len(batch), attempt + 1, exc_info=True)
+
+                    if attempt == self.max_retries:
+                        self._failed_flushes += 1
+                        self._points_dropped += len(batch)
+                        return
+
+                    self._retries += 1
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+        finally:
+            self._semaphore.release()
+
+        duration = time.monotonic() - start
+        logging.debug('Flushed %d points in %.3f s', len(batch), duration)
+        self._points_written += len(batch)
+        self._flushes += 1
+        self._last_flush_duration = duration
+        self._max_flush_duration = max(self._max_flush_duration, duration)
+
+
+async def receive(
+        broker,
+        topics,
+        handle,
+        writer,
+        workers=4,
+        queue_size=10000,
+        stats_interval=60.0,
+        stage=None
+):
+    """Receive ``topics`` on the event loop until cancelled.
+
+    Messages go into a bounded queue, dropping new messages when it is
+    full, and ``workers`` tasks turn them into points with
+    ``handle(topic, payload)`` for ``writer``. A ``stage`` such as
+    ``RollupStage`` takes the points instead when given, and is flushed
+    every second.
+    """
+    put_points = writer.put if stage is None else stage.put
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    disconnected = asyncio.Event()
+    counters = {'messages_received': 0, 'messages_dropped': 0}
+
+    def _on_connect(client, userdata, flags, rc):
+        logging.info('Connected with result code %d', rc)
+        client.subscribe([(topic, 0) for topic in topics])
+
+    def _on_disconnect(client, userdata, rc):
+        logging.warning('Disconnected with result code %d', rc)
+        disconnected.set()
+
+    def _on_message(client, userdata, message):
+        counters['messages_received'] += 1
+
+        try:
+            queue.put_nowait((message.topic, message.payload))
+        except asyncio.QueueFull:
+            counters['messages_dropped'] += 1
+
+    async def _work():
+        while True:
+            topic, payload = await queue.get()
+
+            try:
+                put_points(handle(topic, payload))
+            except Exception:
+                logging.exception('Failed to handle message on %s', topic)
+            finally:
+                queue.task_done()
+
+    async def _reconnect():
+        delay = 1.0
+
+        while True:
+            await disconnected.wait()
+            disconnected.clear()
+
+            while True:
+                await asyncio.sleep(delay)
+
+                try:
+                    client.reconnect()
+                    delay = 1.0
+                    break
+                except OSError:
+                    logging.warning('Reconnection failed', exc_info=True)
+                    delay = min(delay * 2, 60.0)
+
+    client = mqtt.Client('home-iot-{}'.format(uuid.uuid4()))
+    client.on_connect = _on_connect
+    client.on_disconnect = _on_disconnect
+    client.on_message = _on_message
+    PahoAdapter(loop, client)
+
+    await writer.start()
+    client.connect(broker)
+    tasks = [loop.create_task(_work()) for _ in range(workers)]
+    tasks.append(loop.create_task(_reconnect()))
+
+    try:
+        next_stats_time = time.monotonic() + stats_interval
+
+        while True:
+            await asyncio.sleep(1.0)
+
+            if stage is not None:
+                stage.flush()
+
+            if time.monotonic() < next_stats_time:
+                continue
+
+            next_stats_time += stats_interval
+            stats = dict(counters, queue=queue.qsize())
+            stats.update(writer.stats())
+
+            if stage is not None:
+                stats.update(stage.stats())
+
+            logging.info('Receiver statistics: %s', stats)
+    finally:
+        client.disconnect()
+        await queue.join()
+
+        for task in tasks:
+            task.cancel()
+
+        if stage is not None:
+            stage.flush(math.inf)
+
+        await writer.stop()
@@ -0,0 +1,251 @@
+import collections
+import datetime
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+import click
+from influxdb.line_protocol import make_lines
+
+from line_protocol import LineEncoder
+from mqtt_receiver import MessageRouter
+from mqtt_receiver import seismometer_measurements
+from telemetry import decode_payload
+from worker_pool import DecodePool
+
+Message = collections.namedtuple('Message', 'topic payload qos retain')
+
+
+@click.group()
+def cmd():
+    pass
+
+
+def seismometer_messages(messages, topics, readings):
+    """Build synthetic batched seismometer messages over ``topics``."""
+    random.seed(0)
+    floods = []
+
+    for i in range(messages):
+        payload = json.dumps([
+            {
+                'timestamp': 1600000000.0 + i + j / readings,
+                'seismic_scale': random.uniform(-2, 4),
+                'x_acceleration': random.gauss(0, 1),
+                'y_acceleration': random.gauss(0, 1),
+                'z_acceleration': random.gauss(0, 1),
+            }
+            for j in range(readings)
+        ]).encode('utf-8')
+        floods.append(('home/{}/seismometer'.format(i % topics), payload))
+
+    return floods
+
+
+def seismometer_router():
+    return MessageRouter([(
+        'home/+/seismometer',
+        functools.partial(
+            seismometer_measurements, all_output=True, min_scale=-10.0)
+    )])
+
+
+@cmd.command()
+@click.option('--messages', '-n', default=20000)
+@click.option('--topics', '-t', default=16)
+@click.option('--readings', '-r', default=10)
+@click.option('--processes', '-p', default='1,2,4')
+@click.option('--chunk-size', default=100)
+def decode_pool(messages, topics, readings, processes, chunk_size):
+    floods = seismometer_messages(messages, topics, readings)
+    router = seismometer_router()
+    expected = {}
+
+    start_time = time.perf_counter()
+
+    for topic, payload in floods:
+        for point in router.handle(topic, payload):
+            expected.setdefault(topic, []).append(point['time'])
+
+    elapsed = time.perf_counter() - start_time
+    inline_rate = messages / elapsed
+    click.echo('{:<12} {:>10.0f} messages/s'.format('inline', inline_rate))
+
+    for count in (int(p) for p in processes.split(',')):
+        received = {}
+        lock = threading.Lock()
+
+        def _put_points(points):
+            with lock:
+                for point in points:
+                    received.setdefault(
+                        point['measurement'], []).append(point['time'])
+
+        pool = DecodePool(
+            router.handle,
+            _put_points,
+            processes=count,
+            chunk_size=chunk_size,
+            queue_size=messages
+        )
+        pool.start()
+
+        start_time = time.perf_counter()
+
+        for topic, payload in floods:
+            pool.put(topic, payload)
+
+        pool.stop()
+        elapsed = time.perf_counter() - start_time
+
+        if received != expected:
+            raise click.ClickException(
+                '{} processes lost or reordered points'.format(count))
+
+        click.echo(
+            '{:<12} {:>10.0f} messages/s {:>6.2f}x inline'.format(
+                '{} processes'.format(count),
+                messages / elapsed,
+                messages / elapsed / inline_rate
+            )
+        )
+
+
+@cmd.command()
+@click.option('--messages', '-n', default=20000)
+@click.option('--topics', '-t', default=16)
+@click.option('--readings', '-r', default=1)
+def hot_path(messages, topics, readings):
+    floods = [
+        Message(topic, payload, 0, False)
+        for topic, payload in seismometer_messages(messages, topics, readings)
+    ]
+    router = seismometer_router()
+
+    def _per_message_lookup():
+        # The message path before topic handlers were cached
+        points = 0
+
+        for message in floods:
+            logging.debug('Message topic: %s', message.topic)
+            logging.debug('Message QoS: %s', message.qos)
+            logging.debug('Message retain flag: %s', message.retain)
+            logging.debug('Message received: %s', message.payload)
+
+            summaries = []
+
+            for decoder in router.trie.match(message.topic):
+                for reading in decode_payload(message.payload):
+                    measurements = decoder(reading)
+
+                    if measurements is None:
+                        continue
+
+                    if 'timestamp' in reading:
+                        timestamp = datetime.datetime.utcfromtimestamp(
+                            float(reading['timestamp']))
+                    else:
+                        timestamp = datetime.datetime.utcnow()
+
+                    data_summary = {
+                        'measurement': message.topic,
+                        'time': timestamp.isoformat()
+                    }
+                    data_summary.update(measurements)
+                    summaries.append(data_summary)
+
+            if summaries:
+                logging.debug('Data summary: %s', summaries)
+
+            points += len(summaries)
+
+        return points
+
+    def _topic_handlers():
+        points = 0
+
+        for message in floods:
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug(
+                    'Message on %s (QoS %d, retain %s): %s',
+                    message.topic,
+                    message.qos,
+                    message.retain,
+                    message.payload
+                )
+
+            points += len(router.handle(message.topic, message.payload))
+
+        return points
+
+    for name, function in (
+            ('per-message-lookup', _per_message_lookup),
+            ('topic-handlers', _topic_handlers),
+    ):
+        start_time = time.perf_counter()
+        points = function()
+        elapsed = time.perf_counter() - start_time
+
+        click.echo(
+            '{:<20} {:>10.3f} us/message {:>10.0f} messages/s '
+            '{} points'.format(
+                name,
+                elapsed / messages * 1e6,
+                messages / elapsed,
+                points
+            )
+        )
+
+
+@cmd.command()
+@click.option('--messages', '-n', default=2000)
+@click.option('--topics', '-t', default=16)
+@click.option('--readings', '-r', default=10)
+@click.option('--batch-size', '-b', default=500)
+def line_protocol(messages, topics, readings, batch_size):
+    router = seismometer_router()
+    points = []
+
+    for topic, payload in seismometer_messages(messages, topics, readings):
+        points.extend(router.handle(topic, payload))
+
+    batches = [
+        points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+    encoder = LineEncoder()
+
+    def _make_lines():
+        return sum(
+            len(make_lines({'points': batch}, precision='n').encode('utf-8'))
+            for batch in batches
+        )
+
+    def _line_encoder():
+        return sum(len(encoder.encode(batch)) for batch in batches)
+
+    for name, function in (
+            ('make-lines', _make_lines),
+            ('line-encoder', _line_encoder),
+    ):
+        start_time = time.perf_counter()
+        size = function()
+        elapsed = time.perf_counter() - start_time
+
+        click.echo(
+            '{:<20} {:>10.3f} us/point {:>10.0f} points/s {} bytes'.format(
+                name,
+                elapsed / len(points) * 1e6,
+                len(points) / elapsed,
+                size
+            )
+        )
+
+
+def main():
+    cmd()
+
+
+if __name__ == '__main__':
+    main()
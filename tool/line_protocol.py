@@ -0,0 +1,270 @@
+import http.client
+import logging
+import math
+import queue
+import socket
+import threading
+import urllib.parse
+
+MEASUREMENT_ESCAPES = str.maketrans({',': r'\,', ' ': r'\ '})
+KEY_ESCAPES = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ '})
+STRING_ESCAPES = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+
+class LineEncoder:
+    """Encode points as InfluxDB line protocol with nanosecond times.
+
+    The escaped measurement and tag prefix of every measurement and tag
+    set, and the escaped ``key=`` of every field, are built once and then
+    reused for every later point. Non-finite float fields are skipped, as
+    line protocol cannot represent them.
+    """
+
+    def __init__(self, cache_size=10000):
+        self.cache_size = cache_size
+        self._prefixes = {}
+        self._keys = {}
+
+    def encode(self, points):
+        lines = []
+
+        for point in points:
+            line = self._line(point)
+
+            if line is not None:
+                lines.append(line)
+
+        lines.append('')
+
+        return '\n'.join(lines).encode('utf-8')
+
+    def _line(self, point):
+        tags = point.get('tags')
+        cache_key = (
+            point['measurement'],
+            tuple(sorted(tags.items())) if tags else ()
+        )
+        prefix = self._prefixes.get(cache_key)
+
+        if prefix is None:
+            prefix = self._prefix(*cache_key)
+
+        fields = []
+        keys = self._keys
+
+        for name, value in point['fields'].items():
+            key = keys.get(name)
+
+            if key is None:
+                if len(keys) >= self.cache_size:
+                    keys.clear()
+
+                key = keys[name] = str(name).translate(KEY_ESCAPES) + '='
+
+            if isinstance(value, float):
+                if not math.isfinite(value):
+                    continue
+
+                fields.append(key + repr(value))
+            elif isinstance(value, bool):
+                fields.append(key + ('true' if value else 'false'))
+            elif isinstance(value, int):
+                fields.append('{}{}i'.format(key, value))
+            else:
+                fields.append(
+                    '{}"{}"'.format(key, str(value).translate(STRING_ESCAPES)))
+
+        if not fields:
+            return None
+
+        return '{} {} {}'.format(prefix, ','.join(fields), point['time'])
+
+    def _prefix(self, measurement, tags):
+        if len(self._prefixes) >= self.cache_size:
+            self._prefixes.clear()
+
+        prefix = ''.join(
+            [measurement.translate(MEASUREMENT_ESCAPES)]
+            + [
+                ',{}={}'.format(
+                    str(key).translate(KEY_ESCAPES),
+                    str(value).translate(KEY_ESCAPES)
+                )
+                for key, value in tags
+                if value != ''
+            ]
+        )
+        self._prefixes[(measurement, tags)] = prefix
+
+        return prefix
+
+
+class LineProtocolClient:
+    """Stand in for ``InfluxDBClient.write_points`` on top of a sink.
+
+    Points are encoded by a ``LineEncoder`` and handed to ``sink.write``
+    as one body per call.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.encoder = LineEncoder()
+        self._lock = threading.Lock()
+
+    def write_points(
+            self,
+            points,
+            time_precision='n',
+            retention_policy=None
+    ):
+        if time_precision != 'n':
+            raise ValueError('Only nanosecond precision is supported')
+
+        with self._lock:
+            body = self.encoder.encode(points)
+
+        self.sink.write(body, retention_policy)
+
+    def close(self):
+        self.sink.close()
+
+
+class HTTPSink:
+    """Post line protocol to InfluxDB over pooled keep-alive connections."""
+
+    def __init__(
+            self,
+            host,
+            port,
+            database,
+            username=None,
+            password=None,
+            connections=4,
+            timeout=10.0
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._params = {'db': database, 'precision': 'n'}
+
+        if username is not None:
+            self._params.update({'u': username, 'p': password})
+
+        self._connections = queue.LifoQueue(maxsize=connections)
+
+    def write(self, body, retention_policy=None):
+        params = dict(self._params)
+
+        if retention_policy is not None:
+            params['rp'] = retention_policy
+
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+
+        try:
+            connection.request(
+                'POST',
+                '/write?' + urllib.parse.urlencode(params),
+                body,
+                {'Content-Type': 'application/octet-stream'}
+            )
+            response = connection.getresponse()
+            message = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+
+        try:
+            self._connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+        if response.status != 204:
+            raise RuntimeError('HTTP {}: {}'.format(
+                response.status, message.decode('utf-8', 'replace')))
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class UDPSink:
+    """Send line protocol to an InfluxDB UDP listener.
+
+    Bodies are split on line boundaries into datagrams of at most
+    ``max_datagram`` bytes, and lines longer than that are dropped, as
+    half a line is rejected by the listener. The listener decides the
+    database and the retention policy, and nothing tells a lost datagram
+    apart from a delivered one.
+    """
+
+    def __init__(self, host, port=8089, max_datagram=1400):
+        self.address = (host, port)
+        self.max_datagram = max_datagram
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._lines_dropped = 0
+
+    def write(self, body, retention_policy=None):
+        if retention_policy is not None:
+            raise ValueError(
+                'Retention policies are set by the InfluxDB UDP listener')
+
+        start = 0
+
+        while start < len(body):
+            end = start + self.max_datagram
+
+            if end < len(body):
+                # Cut after the last full line that fits in the datagram
+                end = body.rfind(b'\n', start, end) + 1
+
+                if not end:
+                    end = body.find(b'\n', start) + 1 or len(body)
+                    self._lines_dropped += 1
+                    logging.warning(
+                        'Dropped a line of %d bytes longer than a datagram',
+                        end - start)
+                    start = end
+                    continue
+
+            self._socket.sendto(body[start:end], self.address)
+            start = end
+
+    def stats(self):
+        return {'lines_dropped': self._lines_dropped}
+
+    def close(self):
+        self._socket.close()
+
+
+class FileSink:
+    """Append line protocol to a local file for ``influx -import``.
+
+    A new or empty file starts with the ``# DML`` and
+    ``# CONTEXT-DATABASE`` header the import expects. The retention
+    policy of a write is ignored, so every point is imported into the
+    database's default retention policy.
+    """
+
+    def __init__(self, path, database):
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+        if self._file.tell() == 0:
+            self._file.write('# DML\n# CONTEXT-DATABASE: {}\n'.format(
+                database).encode('utf-8'))
+            self._file.flush()
+
+    def write(self, body, retention_policy=None):
+        with self._lock:
+            self._file.write(body)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
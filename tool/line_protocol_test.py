@@ -0,0 +1,23 @@
+import socket
+
+from line_protocol import UDPSink
+
+
+def test_udp_sink_drops_lines_longer_than_a_datagram():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1.0)
+    sink = UDPSink('127.0.0.1', receiver.getsockname()[1], max_datagram=64)
+    short = b'home/seismometer seismic_scale=1.5 1600000000000000000\n'
+    long = b'home/seismometer note="' + b'x' * 100 + b'" 1600000000000000000\n'
+
+    try:
+        sink.write(short + long + short)
+
+        datagrams = [receiver.recv(65536), receiver.recv(65536)]
+    finally:
+        sink.close()
+        receiver.close()
+
+    assert datagrams == [short, short]
+    assert sink.stats() == {'lines_dropped': 1}
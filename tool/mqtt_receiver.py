@@ -1,81 +1,59 @@
-import datetime
+import asyncio
 import functools
 import json
 import logging
+import math
 import os
+import time
 import uuid
 
 import click
 import paho.mqtt.client as mqtt
 from influxdb import InfluxDBClient
 
+from async_receiver import AsyncBatchWriter
+from async_receiver import receive
+from line_protocol import FileSink
+from line_protocol import HTTPSink
+from line_protocol import LineProtocolClient
+from line_protocol import UDPSink
+from rollup import RollupStage
+from rollup import parse_windows
+from spool import Spool
+from telemetry import decode_payload
+from topic_trie import TopicTrie
+from worker_pool import DecodePool
+from writer import BatchWriter
 
-try:
-    db_client = InfluxDBClient(
-        host=os.environ.get('INFLUXDB_HOST') or 'localhost',
-        port=os.environ.get('INFLUXDB_PORT') or 8086,
-        username=os.environ.get('INFLUXDB_USER') or 'root',
-        password=os.environ.get('INFLUXDB_PASSWORD') or 'root',
-        database=os.environ['INFLUXDB_DBNAME']
-    )
-except KeyError:
-    logging.exception('INFLUXDB_DBNAME environment variable not set')
-
-
-@click.group()
-def main():
-    pass
-
-
-def subscribe_mqtt(function):
-    @functools.wraps(function)
-    def wrapper(broker, topic, verbose, *args, **kwargs):
-        def _on_connect(client, userdata, flags, rc):
-            logging.info('Connected with result code %d', rc)
-            client.subscribe(topic)
-
-        def _on_message(client, userdata, message):
-            message_received = message.payload.decode('utf-8')
+SUMMARY_FIELDS = (
+    'min_seismic_scale',
+    'max_seismic_scale',
+    'mean_seismic_scale',
+)
 
-            logging.debug('Message topic: %s', message.topic)
-            logging.debug('Message QoS: %s', message.qos)
-            logging.debug('Message retain flag: %s', message.retain)
-            logging.debug('Message received: %s', message_received)
 
-            decoded_message = json.loads(message_received)
-            measurements = function(
-                broker, topic, verbose, decoded_message, *args, **kwargs)
+ENGINES = ('thread', 'asyncio')
+OUTPUTS = ('influxdb', 'http', 'udp', 'file')
 
-            if measurements is not None:
-                data_summary = {
-                    'measurement': message.topic,
-                    'time': datetime.datetime.utcnow().isoformat()
-                }
-                data_summary.update(measurements)
+INFLUXDB_HOST = os.environ.get('INFLUXDB_HOST') or 'localhost'
+INFLUXDB_PORT = os.environ.get('INFLUXDB_PORT') or 8086
+INFLUXDB_USER = os.environ.get('INFLUXDB_USER') or 'root'
+INFLUXDB_PASSWORD = os.environ.get('INFLUXDB_PASSWORD') or 'root'
+INFLUXDB_DBNAME = os.environ.get('INFLUXDB_DBNAME')
 
-                logging.debug('Data summary: %s', [data_summary])
-                db_client.write_points([data_summary])
-                logging.debug('Data summary has been written into database')
+if INFLUXDB_DBNAME is None:
+    logging.error('INFLUXDB_DBNAME environment variable not set')
 
-        if verbose:
-            logging.basicConfig(level=logging.DEBUG)
+db_client = InfluxDBClient(
+    host=INFLUXDB_HOST,
+    port=INFLUXDB_PORT,
+    username=INFLUXDB_USER,
+    password=INFLUXDB_PASSWORD,
+    database=INFLUXDB_DBNAME
+)
 
-        client = mqtt.Client('home-iot-{}'.format(uuid.uuid4()))
-        client.on_connect = _on_connect
-        client.on_message = _on_message
-        client.connect(broker)
 
-        client.loop_forever()
-
-    return wrapper
-
-
-@main.command()
-@click.argument('broker')
-@click.argument('topic')
-@click.option('--verbose', '-v', is_flag=True)
-@subscribe_mqtt
-def thermometer(broker, topic, verbose, decoded_message):
+def thermometer_measurements(decoded_message):
     return {
         'fields': {
             'temperature': float(decoded_message.get('temperature')),
@@ -86,22 +64,16 @@ def thermometer(broker, topic, verbose, decoded_message):
     }
 
 
-@main.command()
-@click.argument('broker')
-@click.argument('topic')
-@click.option('--verbose', '-v', is_flag=True)
-@click.option('--all-output', '-a', is_flag=True)
-@click.option('--min-scale', '-m', default=-2.0)
-@subscribe_mqtt
-def seismometer(
-        broker,
-        topic,
-        verbose,
+def seismometer_measurements(
         decoded_message,
-        all_output,
-        min_scale
+        all_output=False,
+        min_scale=-2.0
 ):
-    if float(decoded_message.get('seismic_scale')) < min_scale:
+    # Keep heartbeat summaries if any reading they cover reached min-scale
+    max_scale = decoded_message.get(
+        'max_seismic_scale', decoded_message.get('seismic_scale'))
+
+    if float(max_scale) < min_scale:
         return None
 
     measurements = {
@@ -110,6 +82,10 @@ def seismometer(
         }
     }
 
+    for field in SUMMARY_FIELDS:
+        if field in decoded_message:
+            measurements['fields'][field] = float(decoded_message[field])
+
     if all_output:
         measurements['fields'].update({
             'x_acceleration': float(decoded_message.get('x_acceleration')),
@@ -120,12 +96,7 @@ def seismometer(
     return measurements
 
 
-@main.command()
-@click.argument('broker')
-@click.argument('topic')
-@click.option('--verbose', '-v', is_flag=True)
-@subscribe_mqtt
-def soil_sensor(broker, topic, verbose, decoded_message):
+def soil_sensor_measurements(decoded_message):
     return {
         'fields': {
             'moisture_value': int(decoded_message.get('moisture_value')),
@@ -134,5 +105,430 @@ def soil_sensor(broker, topic, verbose, decoded_message):
     }
 
 
+SENSORS = {
+    'thermometer': thermometer_measurements,
+    'seismometer': seismometer_measurements,
+    'soil_sensor': soil_sensor_measurements,
+}
+
+
+def output_client(output, connections, udp_port, output_file):
+    """Return the ``write_points`` client of an ``--output`` choice."""
+    if output == 'influxdb':
+        return db_client
+
+    if output == 'http':
+        sink = HTTPSink(
+            INFLUXDB_HOST,
+            INFLUXDB_PORT,
+            INFLUXDB_DBNAME,
+            username=INFLUXDB_USER,
+            password=INFLUXDB_PASSWORD,
+            connections=connections
+        )
+    elif output == 'udp':
+        sink = UDPSink(INFLUXDB_HOST, udp_port)
+    else:
+        sink = FileSink(output_file, INFLUXDB_DBNAME)
+
+    return LineProtocolClient(sink)
+
+
+def load_routes(config):
+    """Build the topic filter to decoder routes of a ``serve`` config."""
+    routes = []
+
+    for subscription in config['subscriptions']:
+        try:
+            decoder = SENSORS[subscription['sensor']]
+        except KeyError:
+            raise click.BadParameter(
+                'Unknown sensor: {}'.format(subscription['sensor']))
+
+        routes.append((
+            subscription['topic'],
+            functools.partial(decoder, **subscription.get('options', {}))
+        ))
+
+    return routes
+
+
+def data_summaries(topic, readings, decoder):
+    summaries = []
+    now = None
+
+    for reading in readings:
+        measurements = decoder(reading)
+
+        if measurements is None:
+            continue
+
+        # Epoch nanoseconds, the default precision of InfluxDB writes
+        if 'timestamp' in reading:
+            timestamp = int(float(reading['timestamp']) * 1e9)
+        else:
+            if now is None:
+                now = time.time_ns()
+
+            timestamp = now
+
+        measurements['measurement'] = topic
+        measurements['time'] = timestamp
+        summaries.append(measurements)
+
+    return summaries
+
+
+class TopicHandler:
+    """Decode the messages of one topic with its matching decoders."""
+
+    __slots__ = ('topic', 'decoders')
+
+    def __init__(self, topic, decoders):
+        self.topic = topic
+        self.decoders = tuple(decoders)
+
+    def __call__(self, payload):
+        if not self.decoders:
+            return []
+
+        readings = decode_payload(payload)
+
+        if len(self.decoders) == 1:
+            return data_summaries(self.topic, readings, self.decoders[0])
+
+        summaries = []
+
+        for decoder in self.decoders:
+            summaries.extend(data_summaries(self.topic, readings, decoder))
+
+        return summaries
+
+
+class MessageRouter:
+    """Turn messages into points with the decoders of their topic.
+
+    The topic trie is only walked the first time a topic is seen. Its
+    decoders are then kept in a ``TopicHandler``, up to ``cache_size``
+    topics.
+    """
+
+    def __init__(self, routes, cache_size=10000):
+        self.trie = TopicTrie()
+
+        for topic, decoder in routes:
+            self.trie.add(topic, decoder)
+
+        self.topics = sorted({topic for topic, _ in routes})
+        self.cache_size = cache_size
+        self._handlers = {}
+
+    def handle(self, topic, payload):
+        handler = self._handlers.get(topic)
+
+        if handler is None:
+            if len(self._handlers) >= self.cache_size:
+                self._handlers.clear()
+
+            handler = TopicHandler(topic, self.trie.match(topic))
+            self._handlers[topic] = handler
+
+        summaries = handler(payload)
+
+        if summaries and logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug('Data summary: %s', summaries)
+
+        return summaries
+
+
+def subscribe_mqtt(
+        broker,
+        routes,
+        verbose,
+        batch_size,
+        flush_interval,
+        buffer_size,
+        max_retries,
+        stats_interval,
+        spool_dir,
+        spool_max_bytes,
+        engine,
+        workers,
+        queue_size,
+        connections,
+        processes,
+        rollups,
+        raw,
+        rollup_retention_policy,
+        rollup_grace,
+        output,
+        udp_port,
+        output_file
+):
+    """Receive every routed topic over one connection and one writer."""
+    router = MessageRouter(routes)
+
+    def _on_connect(client, userdata, flags, rc):
+        logging.info('Connected with result code %d', rc)
+        client.subscribe([(topic, 0) for topic in router.topics])
+
+    def _on_message(client, userdata, message):
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(
+                'Message on %s (QoS %d, retain %s): %s',
+                message.topic, message.qos, message.retain, message.payload)
+
+        if pool is not None:
+            pool.put(message.topic, message.payload)
+            return
+
+        summaries = router.handle(message.topic, message.payload)
+
+        if summaries:
+            put_points(summaries)
+
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    try:
+        windows = parse_windows(rollups) if rollups else None
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--rollups')
+
+    if output == 'file' and not output_file:
+        raise click.UsageError('--output file requires --output-file')
+
+    if output == 'udp' and rollup_retention_policy:
+        raise click.UsageError(
+            '--rollup-retention-policy is not supported by --output udp')
+
+    if engine == 'asyncio':
+        if spool_dir or processes or rollup_retention_policy:
+            raise click.UsageError(
+                '--spool-dir, --processes and --rollup-retention-policy '
+                'are not supported by the asyncio engine')
+
+        if output not in ('influxdb', 'http'):
+            raise click.UsageError(
+                'The asyncio engine only writes to InfluxDB over HTTP')
+
+        async_writer = AsyncBatchWriter(
+            'http://{}:{}/write'.format(INFLUXDB_HOST, INFLUXDB_PORT),
+            {
+                'db': INFLUXDB_DBNAME,
+                'u': INFLUXDB_USER,
+                'p': INFLUXDB_PASSWORD,
+                'precision': 'n',
+            },
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            buffer_size=buffer_size,
+            max_retries=max_retries,
+            connections=connections
+        )
+        rollup = None
+
+        if windows:
+            rollup = RollupStage(
+                async_writer, windows, keep_raw=raw, grace=rollup_grace)
+
+        try:
+            asyncio.run(receive(
+                broker,
+                router.topics,
+                router.handle,
+                async_writer,
+                workers=workers,
+                queue_size=queue_size,
+                stats_interval=stats_interval,
+                stage=rollup
+            ))
+        except KeyboardInterrupt:
+            pass
+
+        return
+
+    database = output_client(output, connections, udp_port, output_file)
+    spool = Spool(spool_dir, max_bytes=spool_max_bytes) if spool_dir else None
+    writer = BatchWriter(
+        database,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        buffer_size=buffer_size,
+        max_retries=max_retries,
+        spool=spool
+    )
+    writer.start()
+    rollup_writer = None
+    rollup = None
+    pool = None
+
+    if windows:
+        if rollup_retention_policy:
+            rollup_spool = None
+
+            if spool_dir:
+                rollup_spool = Spool(
+                    os.path.join(spool_dir, 'rollups'),
+                    max_bytes=spool_max_bytes
+                )
+
+            rollup_writer = BatchWriter(
+                database,
+                batch_size=batch_size,
+                flush_interval=flush_interval,
+                buffer_size=buffer_size,
+                max_retries=max_retries,
+                spool=rollup_spool,
+                retention_policy=rollup_retention_policy
+            )
+            rollup_writer.start()
+
+        rollup = RollupStage(
+            writer,
+            windows,
+            rollup_writer=rollup_writer,
+            keep_raw=raw,
+            grace=rollup_grace
+        )
+
+    put_points = writer.put if rollup is None else rollup.put
+
+    if processes:
+        pool = DecodePool(router.handle, put_points, processes=processes)
+        pool.start()
+
+    client = mqtt.Client('home-iot-{}'.format(uuid.uuid4()))
+    client.on_connect = _on_connect
+    client.on_message = _on_message
+    client.connect(broker)
+    client.loop_start()
+
+    try:
+        next_stats_time = time.monotonic() + stats_interval
+
+        while True:
+            time.sleep(1.0)
+
+            if rollup is not None:
+                rollup.flush()
+
+            if time.monotonic() < next_stats_time:
+                continue
+
+            next_stats_time += stats_interval
+            logging.info('Writer statistics: %s', writer.stats())
+
+            if pool is not None:
+                logging.info('Decode pool statistics: %s', pool.stats())
+
+            if rollup is not None:
+                logging.info('Rollup statistics: %s', rollup.stats())
+
+            if rollup_writer is not None:
+                logging.info(
+                    'Rollup writer statistics: %s', rollup_writer.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+        if pool is not None:
+            pool.stop()
+
+        if rollup is not None:
+            rollup.flush(math.inf)
+
+        writer.stop()
+
+        if spool is not None:
+            spool.close()
+
+        if rollup_writer is not None:
+            rollup_writer.stop()
+
+            if rollup_writer.spool is not None:
+                rollup_writer.spool.close()
+
+        if database is not db_client:
+            database.close()
+
+
+@click.group()
+def main():
+    pass
+
+
+def receiver_options(function):
+    options = [
+        click.option('--verbose', '-v', is_flag=True),
+        click.option('--batch-size', default=500),
+        click.option('--flush-interval', default=1.0),
+        click.option('--buffer-size', default=100000),
+        click.option('--max-retries', default=5),
+        click.option('--stats-interval', default=60.0),
+        click.option('--spool-dir', type=click.Path(file_okay=False)),
+        click.option('--spool-max-bytes', default=1024 * 1024 * 1024),
+        click.option(
+            '--engine', type=click.Choice(ENGINES), default='thread'),
+        click.option('--workers', default=4),
+        click.option('--queue-size', default=10000),
+        click.option('--connections', default=4),
+        click.option('--processes', default=0),
+        click.option('--rollups', default=''),
+        click.option('--raw/--no-raw', default=True),
+        click.option('--rollup-retention-policy'),
+        click.option('--rollup-grace', default=1.0),
+        click.option(
+            '--output', type=click.Choice(OUTPUTS), default='influxdb'),
+        click.option('--udp-port', default=8089),
+        click.option('--output-file', type=click.Path(dir_okay=False)),
+    ]
+
+    for option in reversed(options):
+        function = option(function)
+
+    return function
+
+
+@main.command()
+@click.argument('config', type=click.File())
+@receiver_options
+def serve(config, **receiver_kwargs):
+    config = json.load(config)
+    subscribe_mqtt(config['broker'], load_routes(config), **receiver_kwargs)
+
+
+@main.command()
+@click.argument('broker')
+@click.argument('topic')
+@receiver_options
+def thermometer(broker, topic, **receiver_kwargs):
+    subscribe_mqtt(
+        broker, [(topic, thermometer_measurements)], **receiver_kwargs)
+
+
+@main.command()
+@click.argument('broker')
+@click.argument('topic')
+@click.option('--all-output', '-a', is_flag=True)
+@click.option('--min-scale', '-m', default=-2.0)
+@receiver_options
+def seismometer(broker, topic, all_output, min_scale, **receiver_kwargs):
+    decoder = functools.partial(
+        seismometer_measurements, all_output=all_output, min_scale=min_scale)
+    subscribe_mqtt(broker, [(topic, decoder)], **receiver_kwargs)
+
+
+@main.command()
+@click.argument('broker')
+@click.argument('topic')
+@receiver_options
+def soil_sensor(broker, topic, **receiver_kwargs):
+    subscribe_mqtt(
+        broker, [(topic, soil_sensor_measurements)], **receiver_kwargs)
+
+
 if __name__ == '__main__':
     main()
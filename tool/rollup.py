@@ -0,0 +1,204 @@
+import re
+import threading
+import time
+
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(windows):
+    """Parse a comma-separated list of windows such as ``1s,1m,1h``."""
+    parsed = []
+
+    for window in windows.split(','):
+        match = re.fullmatch(r'(\d+)([smhd])', window.strip())
+
+        if match is None:
+            raise ValueError('Invalid rollup window: {}'.format(window))
+
+        seconds = int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+        parsed.append((match.group(0), seconds))
+
+    return parsed
+
+
+class RollupStage:
+    """Aggregate points into fixed time windows before they are written.
+
+    Every numeric field of every measurement is summarised per window
+    into ``<field>_min``, ``<field>_max``, ``<field>_mean`` and
+    ``<field>_last`` fields, plus a ``count`` of the points, written to
+    the ``<measurement>_<window>`` measurement through ``rollup_writer``.
+    A window is written as soon as a point of a later window arrives, or
+    by ``flush`` once it has been over for ``grace`` seconds by the
+    receiver's clock, so ``grace`` should cover the clock skew of the
+    devices as well as delivery delays. Points of a window that has
+    already been written are left raw rather than written as a second
+    rollup at the same time, which would overwrite the first. Raw points
+    go on to ``writer`` unless ``keep_raw`` is false.
+    """
+
+    def __init__(
+            self,
+            writer,
+            windows,
+            rollup_writer=None,
+            keep_raw=True,
+            grace=1.0
+    ):
+        self.writer = writer
+        self.windows = windows
+        self.rollup_writer = rollup_writer or writer
+        self.keep_raw = keep_raw
+        self.grace = grace
+        self._buckets = {}
+        self._watermarks = {}
+        self._lock = threading.Lock()
+
+        self._points_aggregated = 0
+        self._points_late = 0
+        self._rollups_written = 0
+
+    def put(self, points):
+        rollups = []
+
+        with self._lock:
+            for point in points:
+                self._aggregate(point, rollups)
+
+            self._points_aggregated += len(points)
+            self._rollups_written += len(rollups)
+
+        if self.keep_raw:
+            self.writer.put(points)
+
+        if rollups:
+            self.rollup_writer.put(rollups)
+
+    def flush(self, now=None):
+        """Write the windows that ended more than ``grace`` seconds ago.
+
+        ``flush(math.inf)`` writes every open window, finished or not.
+        """
+        if now is None:
+            now = time.time()
+
+        rollups = []
+
+        with self._lock:
+            for key, bucket in list(self._buckets.items()):
+                if bucket.end + self.grace <= now:
+                    rollups.append(self._close(key, bucket))
+
+            self._rollups_written += len(rollups)
+
+        if rollups:
+            self.rollup_writer.put(rollups)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'points_aggregated': self._points_aggregated,
+                'points_late': self._points_late,
+                'rollups_written': self._rollups_written,
+                'open_windows': len(self._buckets),
+            }
+
+    def _aggregate(self, point, rollups):
+        timestamp = point['time'] // 1000000000
+        tags = tuple(sorted(point.get('tags', {}).items()))
+        fields = {
+            name: value
+            for name, value in point['fields'].items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+        late = False
+
+        for name, seconds in self.windows:
+            key = (point['measurement'], tags, name)
+            start = timestamp - timestamp % seconds
+            watermark = self._watermarks.get(key)
+            bucket = self._buckets.get(key)
+
+            # Late points of a window already written are left raw
+            if (
+                    (watermark is not None and start <= watermark)
+                    or (bucket is not None and start < bucket.start)
+            ):
+                late = True
+                continue
+
+            if bucket is not None and bucket.start != start:
+                rollups.append(self._close(key, bucket))
+                bucket = None
+
+            if bucket is None:
+                bucket = _Bucket(
+                    '{}_{}'.format(point['measurement'], name),
+                    dict(tags),
+                    start,
+                    seconds
+                )
+                self._buckets[key] = bucket
+
+            bucket.add(fields)
+
+        if late:
+            self._points_late += 1
+
+    def _close(self, key, bucket):
+        del self._buckets[key]
+        self._watermarks[key] = bucket.start
+
+        return bucket.point()
+
+
+class _Bucket:
+    __slots__ = (
+        'measurement', 'tags', 'start', 'end', 'count', 'fields')
+
+    def __init__(self, measurement, tags, start, seconds):
+        self.measurement = measurement
+        self.tags = tags
+        self.start = start
+        self.end = start + seconds
+        self.count = 0
+        self.fields = {}
+
+    def add(self, fields):
+        self.count += 1
+
+        for name, value in fields.items():
+            summary = self.fields.get(name)
+
+            if summary is None:
+                self.fields[name] = [value, value, value, 1, value]
+            else:
+                summary[0] = min(summary[0], value)
+                summary[1] = max(summary[1], value)
+                summary[2] += value
+                summary[3] += 1
+                summary[4] = value
+
+    def point(self):
+        fields = {'count': self.count}
+
+        for name, (minimum, maximum, total, count, last) in (
+                self.fields.items()):
+            fields.update({
+                '{}_min'.format(name): minimum,
+                '{}_max'.format(name): maximum,
+                '{}_mean'.format(name): total / count,
+                '{}_last'.format(name): last,
+            })
+
+        point = {
+            'measurement': self.measurement,
+            'time': self.start * 1000000000,
+            'fields': fields,
+        }
+
+        if self.tags:
+            point['tags'] = self.tags
+
+        return point
@@ -0,0 +1,48 @@
+from rollup import RollupStage
+
+
+class ListWriter:
+    def __init__(self):
+        self.points = []
+
+    def put(self, points):
+        self.points.extend(points)
+
+
+def reading(second, value):
+    return {
+        'measurement': 'home/seismometer',
+        'time': second * 1000000000,
+        'fields': {'seismic_scale': value},
+    }
+
+
+def test_late_point_after_flush_is_left_raw():
+    raw = ListWriter()
+    rollups = ListWriter()
+    stage = RollupStage(raw, [('1m', 60)], rollup_writer=rollups)
+
+    stage.put([reading(60 + i, float(i + 6)) for i in range(10)])
+    stage.flush(121.0)
+    stage.put([reading(90, 100.0)])
+    stage.flush(float('inf'))
+
+    assert len(rollups.points) == 1
+    assert rollups.points[0]['time'] == 60 * 1000000000
+    assert rollups.points[0]['fields']['count'] == 10
+    assert rollups.points[0]['fields']['seismic_scale_mean'] == 10.5
+    assert raw.points[-1] == reading(90, 100.0)
+    assert stage.stats()['points_late'] == 1
+    assert stage.stats()['open_windows'] == 0
+
+
+def test_late_point_before_open_window_is_left_raw():
+    rollups = ListWriter()
+    stage = RollupStage(ListWriter(), [('1s', 1)], rollup_writer=rollups)
+
+    stage.put([reading(10, 1.0), reading(12, 2.0), reading(11, 3.0)])
+    stage.flush(float('inf'))
+
+    assert [point['time'] for point in rollups.points] == [
+        10 * 1000000000, 12 * 1000000000]
+    assert stage.stats()['points_late'] == 1
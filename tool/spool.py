@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import struct
+import zlib
+
+RECORD_HEADER = struct.Struct('<II')
+POSITION = struct.Struct('<QQ')
+POSITION_FILE = 'position'
+SEGMENT_SUFFIX = '.seg'
+
+
+class Spool:
+    """Append-only on-disk queue of point batches.
+
+    Batches are appended to numbered segment files as length and CRC32
+    prefixed JSON records, rolling over to a new segment every
+    ``segment_size`` bytes. The replay position is kept in its own file,
+    replaced atomically on every ``commit``, so a crash replays at most
+    the batches read since the last commit. When the segments grow past
+    ``max_bytes`` the oldest ones are deleted, unread or not.
+    """
+
+    def __init__(
+            self,
+            directory,
+            segment_size=16 * 1024 * 1024,
+            max_bytes=1024 * 1024 * 1024
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._read_segment, self._read_offset = self._load_position()
+        self._sizes = {}
+
+        for name in os.listdir(directory):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+
+            segment = int(name[:-len(SEGMENT_SUFFIX)])
+
+            if segment < self._read_segment:
+                os.remove(self._path(segment))
+            else:
+                self._sizes[segment] = os.path.getsize(self._path(segment))
+
+        self._write_segment = max(self._sizes, default=self._read_segment)
+        self._write_offset = self._valid_size(self._write_segment)
+        self._file = open(self._path(self._write_segment), 'ab')
+
+        # Drop a record torn by a crash in the middle of an append
+        self._file.truncate(self._write_offset)
+        self._sizes[self._write_segment] = self._write_offset
+
+        if self._read_segment not in self._sizes:
+            self._read_segment = min(self._sizes)
+            self._read_offset = 0
+        elif self._read_segment == self._write_segment:
+            self._read_offset = min(self._read_offset, self._write_offset)
+
+        self._batches_spooled = 0
+        self._batches_read = 0
+        self._segments_dropped = 0
+        self._bytes_dropped = 0
+
+    @property
+    def pending(self):
+        return (
+            (self._read_segment, self._read_offset)
+            != (self._write_segment, self._write_offset)
+        )
+
+    def append(self, points):
+        data = json.dumps(points).encode('utf-8')
+
+        if self._write_offset and (
+                self._write_offset + RECORD_HEADER.size + len(data)
+                > self.segment_size
+        ):
+            self._roll()
+
+        self._file.write(RECORD_HEADER.pack(len(data), zlib.crc32(data)))
+        self._file.write(data)
+        self._file.flush()
+        self._write_offset += RECORD_HEADER.size + len(data)
+        self._sizes[self._write_segment] = self._write_offset
+        self._batches_spooled += 1
+        self._enforce_limit()
+
+    def read(self, max_points):
+        """Return the points after the replay position and their end.
+
+        Whole batches are read until at least ``max_points`` points are
+        collected. Pass the returned position to ``commit`` once the
+        points are safely stored.
+        """
+        points = []
+        segment, offset = self._read_segment, self._read_offset
+
+        while len(points) < max_points and (
+                (segment, offset)
+                != (self._write_segment, self._write_offset)
+        ):
+            end = self._sizes[segment]
+
+            with open(self._path(segment), 'rb') as segment_file:
+                segment_file.seek(offset)
+
+                while len(points) < max_points and offset < end:
+                    data = self._read_record(segment_file)
+
+                    if data is None:
+                        logging.warning(
+                            'Skipping corrupted spool segment %d', segment)
+                        offset = end
+                        break
+
+                    points.extend(json.loads(data.decode('utf-8')))
+                    offset = segment_file.tell()
+                    self._batches_read += 1
+
+            if offset >= end and segment != self._write_segment:
+                segment, offset = self._next_segment(segment), 0
+
+        return points, (segment, offset)
+
+    def commit(self, position):
+        self._read_segment, self._read_offset = position
+
+        for segment in sorted(self._sizes):
+            if segment >= self._read_segment:
+                break
+
+            self._remove(segment)
+
+        self._save_position()
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'segments': len(self._sizes),
+            'bytes': sum(self._sizes.values()),
+            'batches_spooled': self._batches_spooled,
+            'batches_read': self._batches_read,
+            'segments_dropped': self._segments_dropped,
+            'bytes_dropped': self._bytes_dropped,
+        }
+
+    def close(self):
+        self._file.close()
+        self._save_position()
+
+    def _path(self, segment):
+        return os.path.join(
+            self.directory, '{:016d}{}'.format(segment, SEGMENT_SUFFIX))
+
+    def _next_segment(self, segment):
+        return min(s for s in self._sizes if s > segment)
+
+    def _roll(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_segment += 1
+        self._write_offset = 0
+        self._sizes[self._write_segment] = 0
+        self._file = open(self._path(self._write_segment), 'ab')
+
+    def _enforce_limit(self):
+        while sum(self._sizes.values()) > self.max_bytes:
+            oldest = min(self._sizes)
+
+            if oldest == self._write_segment:
+                return
+
+            self._segments_dropped += 1
+            self._bytes_dropped += self._sizes[oldest]
+            logging.warning('Spool full, dropping segment %d', oldest)
+            self._remove(oldest)
+
+            if oldest >= self._read_segment:
+                self._read_segment = min(self._sizes)
+                self._read_offset = 0
+                self._save_position()
+
+    def _remove(self, segment):
+        del self._sizes[segment]
+        os.remove(self._path(segment))
+
+    def _read_record(self, segment_file):
+        header = segment_file.read(RECORD_HEADER.size)
+
+        if len(header) < RECORD_HEADER.size:
+            return None
+
+        length, checksum = RECORD_HEADER.unpack(header)
+        data = segment_file.read(length)
+
+        if len(data) < length or zlib.crc32(data) != checksum:
+            return None
+
+        return data
+
+    def _valid_size(self, segment):
+        """Return the length of the intact records of ``segment``."""
+        offset = 0
+
+        try:
+            segment_file = open(self._path(segment), 'rb')
+        except FileNotFoundError:
+            return 0
+
+        with segment_file:
+            while self._read_record(segment_file) is not None:
+                offset = segment_file.tell()
+
+        return offset
+
+    def _load_position(self):
+        path = os.path.join(self.directory, POSITION_FILE)
+
+        try:
+            with open(path, 'rb') as position_file:
+                return POSITION.unpack(position_file.read(POSITION.size))
+        except (FileNotFoundError, struct.error):
+            return 0, 0
+
+    def _save_position(self):
+        path = os.path.join(self.directory, POSITION_FILE)
+        temporary_path = path + '.tmp'
+
+        with open(temporary_path, 'wb') as position_file:
+            position_file.write(
+                POSITION.pack(self._read_segment, self._read_offset))
+            position_file.flush()
+            os.fsync(position_file.fileno())
+
+        os.replace(temporary_path, path)
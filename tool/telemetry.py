@@ -0,0 +1,78 @@
+import json
+import struct
+
+# Binary payloads are made of sections, each starting with the format
+# version, which can never be the first byte of a JSON document, followed
+# by the record type and count of the records that follow
+TELEMETRY_VERSION = 1
+HEADER = struct.Struct('<BBH')
+
+RECORD_FORMATS = {
+    1: (struct.Struct('<d4f'), (
+        'timestamp',
+        'seismic_scale',
+        'x_acceleration',
+        'y_acceleration',
+        'z_acceleration',
+    )),
+    2: (struct.Struct('<4f'), (
+        'temperature',
+        'humidity',
+        'heat_index',
+        'dew_point',
+    )),
+    3: (struct.Struct('<HB'), (
+        'moisture_value',
+        'moisture_level',
+    )),
+    4: (struct.Struct('<d7f'), (
+        'timestamp',
+        'seismic_scale',
+        'x_acceleration',
+        'y_acceleration',
+        'z_acceleration',
+        'min_seismic_scale',
+        'max_seismic_scale',
+        'mean_seismic_scale',
+    )),
+}
+
+
+def decode_payload(payload):
+    """Decode a binary or JSON payload into a list of readings."""
+    if payload[:1] != bytes((TELEMETRY_VERSION,)):
+        readings = json.loads(payload.decode('utf-8'))
+
+        # Batched publishers send a list of readings in one message
+        return readings if isinstance(readings, list) else [readings]
+
+    readings = []
+    start = 0
+
+    while start < len(payload):
+        if len(payload) - start < HEADER.size:
+            raise ValueError('Truncated payload header')
+
+        version, record_type, count = HEADER.unpack_from(payload, start)
+
+        if version != TELEMETRY_VERSION:
+            raise ValueError('Unknown format version: {}'.format(version))
+
+        try:
+            record, fields = RECORD_FORMATS[record_type]
+        except KeyError:
+            raise ValueError('Unknown record type: {}'.format(record_type))
+
+        start += HEADER.size
+        end = start + count * record.size
+
+        if len(payload) < end:
+            raise ValueError('Truncated payload of {} records'.format(count))
+
+        readings.extend(
+            dict(zip(fields, values))
+            for values in record.iter_unpack(payload[start:end])
+        )
+        start = end
+
+    return readings
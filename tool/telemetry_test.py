@@ -0,0 +1,55 @@
+import importlib.util
+import os
+
+import pytest
+
+from telemetry import decode_payload
+
+# The publisher's encoder lives next to the seismometer
+spec = importlib.util.spec_from_file_location(
+    'publisher_telemetry',
+    os.path.join(
+        os.path.dirname(__file__),
+        '..', 'rpi', 'kxr94-2050', 'src', 'telemetry.py'
+    )
+)
+publisher_telemetry = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(publisher_telemetry)
+
+
+def seismometer_reading(timestamp, scale):
+    return {
+        'timestamp': timestamp,
+        'seismic_scale': scale,
+        'x_acceleration': 0.5,
+        'y_acceleration': -0.25,
+        'z_acceleration': 1.0,
+    }
+
+
+def test_binary_heartbeat_round_trip():
+    heartbeat = seismometer_reading(1600000001.5, 1.5)
+    heartbeat.update({
+        'min_seismic_scale': -0.5,
+        'max_seismic_scale': 2.5,
+        'mean_seismic_scale': 0.75,
+    })
+    readings = [
+        seismometer_reading(1600000000.0, 1.0),
+        heartbeat,
+        seismometer_reading(1600000002.0, 2.0),
+    ]
+
+    payload = publisher_telemetry.encode_binary(readings)
+
+    assert decode_payload(payload) == readings
+
+
+def test_binary_truncated_section():
+    payload = publisher_telemetry.encode_binary([
+        seismometer_reading(1600000000.0, 1.0),
+        seismometer_reading(1600000001.0, 1.0),
+    ])
+
+    with pytest.raises(ValueError):
+        decode_payload(payload[:-1])
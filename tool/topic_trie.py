@@ -0,0 +1,64 @@
+class TopicTrie:
+    """Map MQTT topic filters to values.
+
+    Filters may use the ``+`` single-level and ``#`` multi-level
+    wildcards. ``match`` walks the trie one topic level at a time, so a
+    lookup costs the depth of the topic rather than the number of filters.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, topic_filter, value):
+        levels = topic_filter.split('/')
+
+        if '#' in levels[:-1]:
+            raise ValueError(
+                'Multi-level wildcard must be last: {}'.format(topic_filter))
+
+        node = self._root
+
+        for level in levels:
+            node = node.children.setdefault(level, _Node())
+
+        node.values.append(value)
+
+    def match(self, topic):
+        """Return the values of every filter matching ``topic``."""
+        levels = topic.split('/')
+        values = []
+        self._match(self._root, levels, 0, values)
+
+        return values
+
+    def _match(self, node, levels, depth, values):
+        # "a/#" also matches "a" itself
+        multi_level = node.children.get('#')
+
+        # Wildcards never match topics such as "$SYS/..." at the first level
+        wildcards = depth or not levels[0].startswith('$')
+
+        if multi_level is not None and wildcards:
+            values.extend(multi_level.values)
+
+        if depth == len(levels):
+            values.extend(node.values)
+            return
+
+        child = node.children.get(levels[depth])
+
+        if child is not None:
+            self._match(child, levels, depth + 1, values)
+
+        single_level = node.children.get('+')
+
+        if single_level is not None and wildcards:
+            self._match(single_level, levels, depth + 1, values)
+
+
+class _Node:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
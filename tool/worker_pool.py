@@ -0,0 +1,193 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import zlib
+
+
+class DecodePool:
+    """Turn messages into points on a pool of worker processes.
+
+    Each topic is always sent to the same worker, picked from a CRC32 of
+    the topic, and every worker returns its results in the order it
+    received the messages, so points of one topic reach ``put_points`` in
+    the order their messages arrived. Messages are sent in chunks of up
+    to ``chunk_size`` messages, or every ``flush_interval`` seconds, to
+    spread the cost of the inter-process queues. A chunk that does not
+    fit in a worker's inbox of ``queue_size`` chunks is dropped, and a
+    worker that is killed is given up along with the chunks it was sent.
+    """
+
+    def __init__(
+            self,
+            handle,
+            put_points,
+            processes=2,
+            chunk_size=100,
+            flush_interval=0.05,
+            queue_size=1000
+    ):
+        self.handle = handle
+        self.put_points = put_points
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self._context = multiprocessing.get_context('spawn')
+        self._inboxes = [
+            self._context.Queue(queue_size) for _ in range(processes)]
+        self._outbox = self._context.Queue()
+        self._pending = [[] for _ in range(processes)]
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._workers = []
+        self._threads = []
+
+        self._messages_dispatched = 0
+        self._messages_dropped = 0
+        self._chunks_dispatched = 0
+        self._points_collected = 0
+        self._workers_lost = 0
+
+    def start(self):
+        self._stopped.clear()
+        self._workers = [
+            self._context.Process(
+                target=_run_decode_worker,
+                args=(self.handle, shard, inbox, self._outbox),
+                daemon=True
+            )
+            for shard, inbox in enumerate(self._inboxes)
+        ]
+
+        for worker in self._workers:
+            worker.start()
+
+        self._threads = [
+            threading.Thread(target=self._flush, daemon=True),
+            threading.Thread(target=self._collect, daemon=True),
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop once every dispatched message has been collected."""
+        self._stopped.set()
+        self._threads[0].join()
+
+        with self._lock:
+            for shard in range(self.processes):
+                self._send(shard)
+
+        for worker, inbox in zip(self._workers, self._inboxes):
+            while worker.is_alive():
+                try:
+                    inbox.put(None, timeout=1.0)
+                    break
+                except queue.Full:
+                    pass
+
+        self._threads[1].join()
+
+        for worker in self._workers:
+            worker.join()
+
+    def put(self, topic, payload):
+        shard = zlib.crc32(topic.encode('utf-8')) % self.processes
+
+        with self._lock:
+            self._pending[shard].append((topic, payload))
+
+            if len(self._pending[shard]) >= self.chunk_size:
+                self._send(shard)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'messages_dispatched': self._messages_dispatched,
+                'messages_dropped': self._messages_dropped,
+                'chunks_dispatched': self._chunks_dispatched,
+                'points_collected': self._points_collected,
+                'workers_lost': self._workers_lost,
+            }
+
+    def _send(self, shard):
+        chunk = self._pending[shard]
+
+        if not chunk:
+            return
+
+        self._pending[shard] = []
+
+        try:
+            self._inboxes[shard].put_nowait(chunk)
+        except queue.Full:
+            self._messages_dropped += len(chunk)
+            return
+
+        self._messages_dispatched += len(chunk)
+        self._chunks_dispatched += 1
+
+    def _flush(self):
+        while not self._stopped.wait(self.flush_interval):
+            with self._lock:
+                for shard in range(self.processes):
+                    self._send(shard)
+
+    def _collect(self):
+        running = set(range(self.processes))
+        dead = set()
+
+        while running:
+            try:
+                shard, points = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                # A killed worker never answers, give it up once it has
+                # been dead for a whole timeout without its last points
+                for shard in dead & running:
+                    logging.error(
+                        'Decode worker %d died, its chunks are lost', shard)
+                    running.discard(shard)
+
+                    with self._lock:
+                        self._workers_lost += 1
+
+                dead = {
+                    shard for shard in running
+                    if not self._workers[shard].is_alive()
+                }
+                continue
+
+            # Each worker answers the end of its inbox with None
+            if points is None:
+                running.discard(shard)
+                continue
+
+            with self._lock:
+                self._points_collected += len(points)
+
+            self.put_points(points)
+
+
+def _run_decode_worker(handle, shard, inbox, outbox):
+    try:
+        while True:
+            chunk = inbox.get()
+
+            if chunk is None:
+                break
+
+            points = []
+
+            for topic, payload in chunk:
+                try:
+                    points.extend(handle(topic, payload))
+                except Exception:
+                    logging.exception('Failed to handle message on %s', topic)
+
+            if points:
+                outbox.put((shard, points))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        outbox.put((shard, None))
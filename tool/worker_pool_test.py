@@ -0,0 +1,40 @@
+import os
+import signal
+import threading
+
+from worker_pool import DecodePool
+
+
+def decode(topic, payload):
+    return [{'measurement': topic, 'time': int(payload), 'fields': {}}]
+
+
+def test_stop_gives_up_a_killed_worker():
+    points = []
+    pool = DecodePool(decode, points.extend, processes=2, chunk_size=1)
+    pool.start()
+
+    try:
+        os.kill(pool._workers[0].pid, signal.SIGKILL)
+        pool._workers[0].join()
+    finally:
+        stopper = threading.Thread(target=pool.stop, daemon=True)
+        stopper.start()
+        stopper.join(10.0)
+
+    assert not stopper.is_alive()
+    assert pool.stats()['workers_lost'] == 1
+
+
+def test_stop_collects_every_point():
+    points = []
+    pool = DecodePool(decode, points.extend, processes=2, chunk_size=10)
+    pool.start()
+
+    for i in range(100):
+        pool.put('home/{}/seismometer'.format(i % 4), str(i))
+
+    pool.stop()
+
+    assert sorted(point['time'] for point in points) == list(range(100))
+    assert pool.stats()['workers_lost'] == 0
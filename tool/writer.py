@@ -0,0 +1,265 @@
+import collections
+import logging
+import threading
+import time
+
+
+class BatchWriter:
+    """Write points to InfluxDB from a worker thread.
+
+    ``put`` never blocks: points queue up in a bounded buffer that drops
+    the oldest point when full. The worker flushes as soon as
+    ``batch_size`` points are buffered or the oldest buffered point is
+    ``flush_interval`` seconds old. A failed write is retried with
+    exponential backoff, up to ``max_retries`` times, before the batch is
+    given up.
+
+    With a ``spool``, a failed write is not retried in place: the batch
+    and every batch after it go to the spool, as does the backlog when
+    the database falls behind, and the spool is replayed in batches of
+    ``replay_size`` points as soon as the backoff delay allows.
+    """
+
+    def __init__(
+            self,
+            db_client,
+            batch_size=500,
+            flush_interval=1.0,
+            buffer_size=100000,
+            max_retries=5,
+            retry_delay=0.5,
+            max_retry_delay=30.0,
+            spool=None,
+            replay_size=5000,
+            retention_policy=None
+    ):
+        self.db_client = db_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.spool = spool
+        self.replay_size = replay_size
+        self.retention_policy = retention_policy
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._oldest_time = None
+        self._retry_time = 0.0
+        self._retry_delay = retry_delay
+        self._stopped = False
+        self._thread = None
+
+        self._points_written = 0
+        self._points_dropped = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._retries = 0
+        self._points_spooled = 0
+        self._points_replayed = 0
+        self._last_flush_duration = 0.0
+        self._max_flush_duration = 0.0
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker once every buffered point has been flushed."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        self._thread.join()
+
+    def put(self, points):
+        with self._condition:
+            for point in points:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._points_dropped += 1
+
+                self._buffer.append(point)
+
+            # Wake the worker so it arms the flush interval timeout
+            if self._oldest_time is None and self._buffer:
+                self._oldest_time = time.monotonic()
+                self._condition.notify()
+            elif len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'points_written': self._points_written,
+                'points_dropped': self._points_dropped,
+                'flushes': self._flushes,
+                'failed_flushes': self._failed_flushes,
+                'retries': self._retries,
+                'points_spooled': self._points_spooled,
+                'points_replayed': self._points_replayed,
+                'last_flush_duration': self._last_flush_duration,
+                'max_flush_duration': self._max_flush_duration,
+                'buffered': len(self._buffer),
+            }
+
+    def _flush_due(self):
+        return (
+            self._stopped
+            or len(self._buffer) >= self.batch_size
+            or (
+                self._oldest_time is not None
+                and time.monotonic() - self._oldest_time
+                >= self.flush_interval
+            )
+            or self._replay_due()
+        )
+
+    def _replay_due(self):
+        return (
+            self.spool is not None
+            and self.spool.pending
+            and time.monotonic() >= self._retry_time
+        )
+
+    def _wait_timeout(self):
+        deadlines = []
+
+        if self._oldest_time is not None:
+            deadlines.append(self._oldest_time + self.flush_interval)
+
+        if self.spool is not None and self.spool.pending:
+            deadlines.append(self._retry_time)
+
+        if not deadlines:
+            return None
+
+        return max(0, min(deadlines) - time.monotonic())
+
+    def _write(self):
+        while True:
+            with self._condition:
+                while not self._flush_due():
+                    self._condition.wait(self._wait_timeout())
+
+                if self._stopped and not self._buffer:
+                    return
+
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self.batch_size, len(self._buffer)))
+                ]
+                backlog = []
+
+                # The database is falling behind, move the backlog to disk
+                # rather than letting the buffer overflow
+                if self.spool is not None and (
+                        len(self._buffer) >= self.batch_size):
+                    backlog = list(self._buffer)
+                    self._buffer.clear()
+
+                self._oldest_time = time.monotonic() if self._buffer else None
+
+            if self.spool is None:
+                self._flush(batch)
+            else:
+                self._spool_flush(batch, backlog)
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        delay = self.retry_delay
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.db_client.write_points(
+                    batch,
+                    time_precision='n',
+                    retention_policy=self.retention_policy
+                )
+                break
+            except Exception:
+                logging.warning(
+                    'Failed to write %d points (attempt %d)',
+                    len(batch), attempt + 1, exc_info=True)
+
+                if attempt == self.max_retries:
+                    with self._condition:
+                        self._failed_flushes += 1
+                        self._points_dropped += len(batch)
+
+                    return
+
+                with self._condition:
+                    self._retries += 1
+
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+        self._record_flush(len(batch), time.monotonic() - start)
+
+    def _spool_flush(self, batch, backlog):
+        # Keep the order of the points once anything has been spooled
+        if batch and (
+                self.spool.pending
+                or time.monotonic() < self._retry_time
+                or not self._try_write(batch)
+        ):
+            self._spool_append(batch)
+
+        if backlog:
+            self._spool_append(backlog)
+
+        if self._replay_due():
+            points, position = self.spool.read(self.replay_size)
+
+            # Corrupted records are skipped without any point to write
+            if not points or self._try_write(points):
+                self.spool.commit(position)
+
+                with self._condition:
+                    self._points_replayed += len(points)
+
+    def _spool_append(self, points):
+        self.spool.append(points)
+
+        with self._condition:
+            self._points_spooled += len(points)
+
+    def _try_write(self, points):
+        """Write ``points`` once, backing off further writes on failure."""
+        start = time.monotonic()
+
+        try:
+            self.db_client.write_points(
+                points,
+                time_precision='n',
+                retention_policy=self.retention_policy
+            )
+        except Exception:
+            logging.warning(
+                'Failed to write %d points, retrying in %.1f s',
+                len(points), self._retry_delay, exc_info=True)
+            self._retry_time = time.monotonic() + self._retry_delay
+            self._retry_delay = min(
+                self._retry_delay * 2, self.max_retry_delay)
+
+            with self._condition:
+                self._failed_flushes += 1
+                self._retries += 1
+
+            return False
+
+        self._retry_delay = self.retry_delay
+        self._record_flush(len(points), time.monotonic() - start)
+
+        return True
+
+    def _record_flush(self, count, duration):
+        logging.debug('Flushed %d points in %.3f s', count, duration)
+
+        with self._condition:
+            self._points_written += count
+            self._flushes += 1
+            self._last_flush_duration = duration
+            self._max_flush_duration = max(
+                self._max_flush_duration, duration)